@@ -0,0 +1,99 @@
+import csv
+import glob
+import os
+import sys
+
+# run as a script, this folder is first on sys.path and its csvParser.py
+# would shadow the csvParser folder, so the repository root replaces it
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path = [path for path in sys.path if os.path.abspath(path) != _here]
+sys.path.append(os.path.join(_here, '..'))
+from csvParser.csvParser import csvParser, classifyPlays
+
+# (detail, down, toGo) edge cases the per-row methods already handle
+EDGE_CASES = [
+    # no play
+    ("Robbie Gould 45 yard field goal no good, no play (Offensive Holding)", '4', '7'),
+    ("Robbie Gould 45 yard field goal good (no play)", '4', '7'),
+    ("Penalty on SFO: False Start, 5 yards (no play)", '3', '4'),
+    ("Brock Purdy pass incomplete short right, no play (Defensive Holding)", '2', '10'),
+    # extra points and two point attempts
+    ("Jake Moody kicks extra point good", '', ''),
+    ("Two Point Attempt: Christian McCaffrey left end, conversion succeeds", '', ''),
+    # spikes and kneels
+    ("Brock Purdy spiked the ball", '2', '10'),
+    ("Brock Purdy kneels for -1 yards", '1', '10'),
+    # fumbles with and without recovery
+    ("Christian McCaffrey right tackle for 3 yards. Christian McCaffrey fumbles (forced by Fred Warner), recovered by Rams at SFO 30", '2', '5'),
+    ("Brock Purdy sacked by Aaron Donald for -8 yards. Brock Purdy fumbles, recovered by Brock Purdy at SFO 22", '3', '6'),
+    ("Deebo Samuel middle for 2 yards. Deebo Samuel fumbles, out of bounds", '1', '10'),
+    # scoring, turnovers, kicks
+    ("Brock Purdy pass complete deep left to George Kittle for 40 yards, touchdown", '1', '10'),
+    ("Brock Purdy pass intended for Brandon Aiyuk is intercepted by Jalen Ramsey at LAR 10", '2', '7'),
+    ("Mitch Wishnowsky punts 45 yards, fair catch by Cooper Kupp at LAR 20", '4', '12'),
+    ("Jake Moody 38 yard field goal good", '4', '3'),
+    # fourth down conversions, with the first digit token as yards
+    ("Christian McCaffrey up the middle for 2 yards", '4', '1'),
+    ("Christian McCaffrey up the middle for 2 yards", '4', '3'),
+    ("Christian McCaffrey up the middle for no gain", '4', '1'),
+    ("Kyle Juszczyk left guard for 1 yard (tackle by 99 Aaron Donald)", '4', '1'),
+    ("Elijah Mitchell right end for 12 yards", '3', '10'),
+    # nothing to classify
+    ("Timeout #1 by San Francisco 49ers", '', ''),
+    ("", '', ''),
+]
+
+
+def perRowLabels(details, playDowns, toGos):
+    playActions, terminals, yards = [], [], []
+    for detail, down, toGo in zip(details, playDowns, toGos):
+        action = csvParser.createAction(None, detail)
+        playActions.append(action or 0)
+        digits = [int(i) for i in detail.split() if i.isdigit()]
+        yards.append(digits[0] if digits else float('-inf'))
+        try:
+            terminals.append(csvParser.isTerminalState(None, down, toGo, action, detail))
+        except ValueError:
+            # a 4th down row without a numeric toGo; the batch classifier says False
+            terminals.append(False)
+    return playActions, terminals, yards
+
+
+def readPlays(pattern='data/*/*Week*.csv'):
+    details, playDowns, toGos = [], [], []
+    for path in glob.glob(pattern):
+        if 'Drives' in path:
+            continue
+        with open(path, 'r') as f:
+            for row in csv.reader(f):
+                if len(row) == 10:
+                    playDowns.append(row[2])
+                    toGos.append(row[3])
+                    details.append(row[7])
+    return details, playDowns, toGos
+
+
+def checkParity(details, playDowns, toGos):
+    expected = perRowLabels(details, playDowns, toGos)
+    actual = classifyPlays(details, playDowns, toGos)
+    mismatches = 0
+    for name, want, got in zip(['action', 'terminal', 'yards'], expected, actual):
+        for i, (w, g) in enumerate(zip(want, got)):
+            if w != g:
+                mismatches += 1
+                print('mismatch', name, repr(details[i]), playDowns[i], toGos[i], w, g)
+    return mismatches
+
+
+# usage: python csvParser/classifierParity.py (from the repository root)
+def main():
+    edgeCases = [list(column) for column in zip(*EDGE_CASES)]
+    mismatches = checkParity(*edgeCases)
+    plays = readPlays()
+    mismatches += checkParity(*plays)
+    print(len(EDGE_CASES), 'edge cases,', len(plays[0]), 'plays,', mismatches, 'mismatches')
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
+from bisect import bisect_left
 from decimal import Decimal
+import numpy as np
 import pandas as pd
 import csv
 import os 
@@ -22,14 +23,57 @@ class terminalStates(enumerate):
     punt = 3
     turnover = 4 # turnover on downs, interception, fumble, and missed field goal
 
+# number of play-by-play rows classified together
+CHUNK_SIZE = 256
+# first whitespace separated token made only of digits
+YARDS_PATTERN = r'(?:^|\s)(\d+)(?=\s|$)'
+
+"""
+Batch version of csvParser.createAction and csvParser.isTerminalState.
+Takes whole columns of play details, downs and toGo strings.
+
+Returns three numpy arrays:
+actions: 1-4 as in the actions class, 0 where createAction returns None
+terminal: True where isTerminalState would be True for that action
+yards: first digit-only token of the detail, -inf if there is none
+"""
+def classifyPlays(details, playDowns, toGos):
+    details = pd.Series(details, dtype=object).astype(str)
+    contains = lambda text: details.str.contains(text, regex=False).to_numpy()
+
+    isPass = contains('pass')
+    isRun = ~isPass & (contains('right') | contains('left') | contains('middle'))
+    isFieldGoal = ~isPass & ~isRun & contains('field goal') & ~contains('no play')
+    isPunt = ~isPass & ~isRun & ~isFieldGoal & contains('punt')
+    playActions = np.select(
+        [isPass, isRun, isFieldGoal, isPunt],
+        [actions.passing, actions.run, actions.fieldGoal, actions.punt],
+        default=0,
+    )
+
+    yards = pd.to_numeric(details.str.extract(YARDS_PATTERN)[0]).fillna(float('-inf')).to_numpy()
+    toGos = pd.to_numeric(pd.Series(toGos, dtype=object), errors='coerce').to_numpy(dtype=float)
+    fourthDown = pd.Series(playDowns, dtype=object).to_numpy() == downs.fourthDown
+    terminal = (
+        isFieldGoal | isPunt
+        | contains('touchdown') | contains('intercept')
+        | (contains('fumble') & contains('recovered'))
+        | (fourthDown & (toGos <= yards))
+    )
+    return playActions, terminal, yards
+
 class csvParser(object):
+    # data and drives are file paths or already opened text streams
+    # (e.g. members of a zip archive)
     def __init__(self, data, drives, targetTeam):
         # every key in data is the following 
         self.data = []
-        self.file = open(data, 'r')
-        self.drives = open(drives, 'r')
+        self.file = data if hasattr(data, 'readline') else open(data, 'r')
+        self.drives = drives if hasattr(drives, 'readline') else open(drives, 'r')
+        # (start, end) clock seconds of every target team drive, per quarter
         self.possessions = {key: [] for key in range(1,5)}
         self.readDrives()
+        self.indexPossessions()
         self.targetTeam = targetTeam
         self.currPossession = None
         quarter,time,down,toGo,location,home,away,detail,EPB,EPA = self.file.readline().strip().split(',')
@@ -47,61 +91,88 @@ class csvParser(object):
             self.possessions[int(quarter)].append(duration)
         self.drives.close()
 
+    # Merges each quarter's drives into sorted, disjoint (end, start] clock
+    # intervals so isTargetPossession can bisect instead of scanning.
+    def indexPossessions(self):
+        self.possessionIndex = {}
+        for quarter, drives in self.possessions.items():
+            intervals = sorted((end, start) for start, end in drives if start > end)
+            ends, starts = [], []
+            for end, start in intervals:
+                if ends and end <= starts[-1]:
+                    starts[-1] = max(starts[-1], start)
+                else:
+                    ends.append(end)
+                    starts.append(start)
+            self.possessionIndex[quarter] = (ends, starts)
+
     def readLine(self):
+        self.data.extend(self.iterTransitions())
+
+    # Streams the play-by-play file and yields one [s, a, r, s'] transition
+    # at a time. A transition is held back until the next one is known, so
+    # its s' can be linked to the following state.
+    def iterTransitions(self):
         self.file.readline()
+        self.previousState = None
+        for rows in self.readChunks():
+            # classify the whole chunk of play details at once
+            playActions, terminals, _ = classifyPlays([row[7] for row in rows], [row[2] for row in rows], [row[3] for row in rows])
+            for row, currentAction, terminal in zip(rows, playActions, terminals):
+                quarter, time, down, toGo, location, home, away, detail, EPB, EPA = row
+                endzoneDistance = None
+                self.currPossession = self.isTargetPossession(quarter, time)
+                currentAction = int(currentAction) or None
+                # Handles edge cases for nontarget team possessing the ball, QB kneels/spikes, extra point, and plays that don't have downs
+                if not self.currPossession or 'point' in detail or not down or not currentAction:
+                    continue
+                # If the target team who possesses the ball is on their own turf, then the endzone distance is 100 - the yard line
+                if self.targetTeam == location.split(' ')[0]:
+                    endzoneDistance = 100 - int(location.split(' ')[1])
+                else:
+                    endzoneDistance = int(location.split(' ')[1])
+                #s, a, r, s' where s = (down, toGo, endzoneDistance), a = action, r = reward, s' = next state or 'TERMINAL'
+                newState = [self.createState(int(down), int(toGo), int(endzoneDistance)) , currentAction, self.createReward(EPB, EPA), 'TERMINAL' if terminal else '']
+                # If there exists a previous state, then we can link the previous state to the current state
+                if self.previousState:
+                    if not 'TERMINAL' in self.previousState[3]:
+                        self.previousState[3] = newState[0]
+                    yield self.previousState
+                self.previousState = newState
+        self.file.close()
+        # last state before end of game should also be terminal
+        if self.previousState:
+            self.previousState[3] = 'TERMINAL'
+            yield self.previousState
+
+    # Yields lists of up to CHUNK_SIZE play rows, stopping at the first blank row
+    def readChunks(self):
         csv_reader = csv.reader(self.file)
+        rows = []
         for row in csv_reader:
             if not row or row == ['']:
                 break
-            quarter, time, down, toGo, location, home, away, detail, EPB, EPA = row
-            endzoneDistance = None
-            self.previousState = None
-            self.currPossession = self.isTargetPossession(quarter, time)
-            currentAction = self.createAction(detail)
-            # Handles edge cases for nontarget team possessing the ball, QB kneels/spikes, extra point, and plays that don't have downs
-            if not self.currPossession or 'point' in detail or not down or not currentAction:
-                continue
-            # If the target team who possesses the ball is on their own turf, then the endzone distance is 100 - the yard line
-            if self.targetTeam == location.split(' ')[0]:
-                endzoneDistance = 100 - int(location.split(' ')[1])
-            else:
-                endzoneDistance = int(location.split(' ')[1])
-            # If there exists a previous state, then we can link the previous state to the current state
-            if self.data and self.data[-1][0]:
-                self.previousState = self.data[-1]
-            #s, a, r, s' where s = (down, toGo, endzoneDistance), a = action, r = reward, s' = next state or 'TERMINAL'
-            newState = [self.createState(int(down), int(toGo), int(endzoneDistance)) , currentAction, self.createReward(EPB, EPA), 'TERMINAL' if self.isTerminalState(down, toGo, currentAction, detail) else '']
-            if self.previousState and not 'TERMINAL' in self.previousState[3]:
-                self.previousState[3] = newState[0]
-            self.data.append(newState)
-        # last state before end of game should also be terminal
-        self.data[-1][3] = 'TERMINAL'
-        self.file.close()
+            rows.append(row)
+            if len(rows) == CHUNK_SIZE:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
 
+    # clock strings ('MM:SS') are kept as integer seconds
     def convertTime(self, time):
-        time_format = '%M:%S'
-        return datetime.strptime(time, time_format)
+        minutes, seconds = time.split(':')
+        return int(minutes) * 60 + int(seconds)
     
     def subtractDuration(self, time_str, duration_str):
-        # Parse time and duration strings
-        time_format = '%M:%S'
-        time = datetime.strptime(time_str, time_format)
-
-        duration = datetime.strptime(duration_str, time_format)
-
         # Subtract duration from time
-        result = time - duration
+        result = self.convertTime(time_str) - self.convertTime(duration_str)
         
         # Handle negative result by wrapping around to the next quarter
-        if result < timedelta():
-            result += timedelta(minutes=15)
-
-        # Format the result as minutes and seconds
-        result_minutes, result_seconds = divmod(result.seconds, 60)
+        if result < 0:
+            result += 15 * 60
 
-        # Convert back to 'MM:SS' string format
-        new_time = '{:02d}:{:02d}'.format(result_minutes, result_seconds)
-        return self.convertTime(new_time)
+        return result
 
     def createState(self, down, toGo, endzoneDistance):
         return (down, toGo, endzoneDistance)
@@ -123,11 +194,10 @@ class csvParser(object):
     
     def isTargetPossession(self, quarter, time):
         time = self.convertTime(time)
-        checkQuarter = self.possessions[int(quarter)]
-        for possession in checkQuarter:
-            if possession[0] >= time and time > possession[1]:
-                return True
-        return False
+        ends, starts = self.possessionIndex[int(quarter)]
+        # last interval whose end is before time
+        i = bisect_left(ends, time) - 1
+        return i >= 0 and time <= starts[i]
         
     def isTerminalState(self, down, toGo, action, detail):
         yards = [int(i) for i in detail.split() if i.isdigit()]
@@ -141,7 +211,7 @@ class csvParser(object):
 # example.readLine()
 
 #### ADDED #####
-def convert_to_csv(data, output_fp):
+def convert_to_csv(data, output_fp, verbose=False):
     # Define data types for each column
     # dtypes = {'State': list, 'Action': int, 'Reward': float, 'Next_State': list}
     df = pd.DataFrame(data, columns=['State', 'Action', 'Reward', 'Next_State'])
@@ -158,7 +228,8 @@ def convert_to_csv(data, output_fp):
 
     df.to_csv(output_fp, index=False, sep=';')
 
-    print(df)
+    if verbose:
+        print(df)
 
 # example = csvParser('data/2023SeasonData/sfWeek10.csv', 'data/2023SeasonData/sfDrives2023Week10.csv', 'SFO')
 # example.readLine()
@@ -166,10 +237,12 @@ def convert_to_csv(data, output_fp):
 # convert_to_csv(example.data)
 
 def cleaned_data_files(year_str):
+    # year_str is e.g. "21_22" for the 2021 season
+    season = '20' + year_str.split('_')[0]
     for week_num in range(1, 22):  # for 22_23/21_22, last 19,20,21 is wild, div,conf. 
-        # get data path (have to edit by year)
-        data_path = 'data/2021SeasonData/sfWeek' + str(week_num) + '.csv'
-        data_drive_path = 'data/2021SeasonData/sfDrives2021Week' + str(week_num) + '.csv'
+        # get data path
+        data_path = 'data/' + season + 'SeasonData/sfWeek' + str(week_num) + '.csv'
+        data_drive_path = 'data/' + season + 'SeasonData/sfDrives' + season + 'Week' + str(week_num) + '.csv'
         # check if the path exists
         if not os.path.exists(data_path) or not os.path.exists(data_drive_path):
             continue
@@ -178,10 +251,11 @@ def cleaned_data_files(year_str):
         generated_data = csvParser(data_path, data_drive_path, 'SFO')
         generated_data.readLine()
         # save in csv 
-        output_fp = 'data_cleaned/cleaned_2021_data/' + year_str + '_week_' + str(week_num) + '.csv'
+        output_fp = 'data_cleaned/cleaned_' + season + '_data/' + year_str + '_week_' + str(week_num) + '.csv'
         convert_to_csv(generated_data.data, output_fp)
         # except:
             # continue
 
 
-cleaned_data_files("21_22")
\ No newline at end of file
+if __name__ == '__main__':
+    cleaned_data_files("21_22")
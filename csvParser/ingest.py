@@ -0,0 +1,177 @@
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# run as a script, this folder is first on sys.path and its csvParser.py
+# would shadow the csvParser folder, so the repository root replaces it
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path = [path for path in sys.path if os.path.abspath(path) != _here]
+sys.path.append(os.path.join(_here, '..'))
+from csvParser.csvParser import csvParser, convert_to_csv
+
+# prefix of the play-by-play and drive file names of each team
+TEAM_FILE_PREFIXES = {'SFO': 'sf'}
+# team whose cleaned files go to the plain data_cleaned/cleaned_YYYY_data folders
+DEFAULT_TEAM = 'SFO'
+
+
+def year_string(season):
+    # 2021 -> "21_22"
+    return '{:02d}_{:02d}'.format(season % 100, (season + 1) % 100)
+
+
+def output_folder(season, team):
+    if team == DEFAULT_TEAM:
+        return 'data_cleaned/cleaned_' + str(season) + '_data'
+    return 'data_cleaned/cleaned_' + str(season) + '_' + team + '_data'
+
+
+"""
+Finds every (sfWeekN.csv, sfDrivesYYYYWeekN.csv) pair of a season and team.
+Returns one task per game: (team, data path, drive path, output path)
+"""
+def find_games(season, team=DEFAULT_TEAM, data_dir='data'):
+    prefix = TEAM_FILE_PREFIXES.get(team, team.lower())
+    season_dir = os.path.join(data_dir, str(season) + 'SeasonData')
+    if not os.path.isdir(season_dir):
+        return []
+
+    week_pattern = re.compile(re.escape(prefix) + r'Week(\d+)\.csv$')
+    tasks = []
+    for filename in os.listdir(season_dir):
+        match = week_pattern.match(filename)
+        if not match:
+            continue
+        week_num = int(match.group(1))
+        data_path = os.path.join(season_dir, filename)
+        data_drive_path = os.path.join(season_dir, prefix + 'Drives' + str(season) + 'Week' + str(week_num) + '.csv')
+        if not os.path.exists(data_drive_path):
+            continue
+        output_fp = os.path.join(output_folder(season, team), year_string(season) + '_week_' + str(week_num) + '.csv')
+        tasks.append((week_num, (team, data_path, data_drive_path, output_fp)))
+
+    return [task for week_num, task in sorted(tasks)]
+
+
+"""
+Finds every weekly play / drive csv pair inside a zip archive. Members are
+paired by (archive directory, week number), so an archive holding several
+seasons in their own directories never pairs a play file with another
+season's drives. The season is read from the drives file name. Members
+without a partner are reported and skipped, and a directory with two
+files for the same week, or two directories with the same season and
+week, raise ValueError.
+Returns tasks like find_games, with the archive path appended
+"""
+def find_archive_games(archive_path, team=DEFAULT_TEAM):
+    prefix = TEAM_FILE_PREFIXES.get(team, team.lower())
+    week_pattern = re.compile(r'(?:^|/)' + re.escape(prefix) + r'Week(\d+)\.csv$')
+    drive_pattern = re.compile(r'(?:^|/)' + re.escape(prefix) + r'Drives(\d{4})Week(\d+)\.csv$')
+
+    plays, drives = {}, {}
+    with zipfile.ZipFile(archive_path) as archive:
+        for name in archive.namelist():
+            directory = os.path.dirname(name)
+            match = week_pattern.search(name)
+            if match:
+                members, key, member = plays, (directory, int(match.group(1))), name
+            else:
+                match = drive_pattern.search(name)
+                if not match:
+                    continue
+                members, key, member = drives, (directory, int(match.group(2))), (int(match.group(1)), name)
+            if key in members:
+                raise ValueError('two ' + team + ' files for week ' + str(key[1]) + ' in ' + archive_path + ':' + key[0])
+            members[key] = member
+
+    for key in sorted(set(plays) ^ set(drives)):
+        print('unpaired', archive_path + ':' + (plays[key] if key in plays else drives[key][1]))
+
+    tasks, outputs = [], set()
+    for key in sorted(set(plays) & set(drives)):
+        week_num = key[1]
+        season, drive_member = drives[key]
+        output_fp = os.path.join(output_folder(season, team), year_string(season) + '_week_' + str(week_num) + '.csv')
+        if output_fp in outputs:
+            raise ValueError('season ' + str(season) + ' week ' + str(week_num) + ' appears twice in ' + archive_path)
+        outputs.add(output_fp)
+        tasks.append((team, plays[key], drive_member, output_fp, archive_path))
+    return tasks
+
+
+"""
+Parses one game and writes its cleaned transitions. Tasks with an archive
+path read their csv members straight from the zip file.
+Returns (output path, number of transitions, error message or None)
+"""
+def ingest_game(task):
+    team, data_path, data_drive_path, output_fp = task[:4]
+    archive_path = task[4] if len(task) > 4 else None
+    try:
+        if archive_path is None:
+            generated_data = csvParser(data_path, data_drive_path, team)
+            generated_data.readLine()
+        else:
+            with zipfile.ZipFile(archive_path) as archive:
+                data = io.TextIOWrapper(archive.open(data_path), encoding='utf-8')
+                drives = io.TextIOWrapper(archive.open(data_drive_path), encoding='utf-8')
+                generated_data = csvParser(data, drives, team)
+                generated_data.readLine()
+        convert_to_csv(generated_data.data, output_fp)
+    except Exception as e:
+        return output_fp, 0, repr(e)
+    return output_fp, len(generated_data.data), None
+
+
+"""
+Cleans every game of the given seasons and teams, plus every game found in
+the given zip archives, across a process pool, one game per task.
+processes=None uses all cores.
+"""
+def ingest_seasons(seasons, teams=(DEFAULT_TEAM,), processes=None, data_dir='data', archives=()):
+    tasks = []
+    for season in seasons:
+        for team in teams:
+            tasks.extend(find_games(season, team, data_dir))
+    for archive_path in archives:
+        for team in teams:
+            tasks.extend(find_archive_games(archive_path, team))
+    for folder in set(os.path.dirname(task[3]) for task in tasks):
+        os.makedirs(folder, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(ingest_game, tasks))
+
+    for output_fp, count, error in results:
+        if error is not None:
+            print('failed', output_fp, error)
+    return results
+
+
+# usage: python csvParser/ingest.py 2021 2022 [--teams SFO,...] [--archive data/23_24_data_renamed.zip]
+def main():
+    args = sys.argv[1:]
+    teams = [DEFAULT_TEAM]
+    if '--teams' in args:
+        i = args.index('--teams')
+        teams = args[i + 1].split(',')
+        args = args[:i] + args[i + 2:]
+    archives = []
+    while '--archive' in args:
+        i = args.index('--archive')
+        archives.append(args[i + 1])
+        args = args[:i] + args[i + 2:]
+    seasons = [int(season) for season in args]
+    if not seasons and not archives:
+        seasons = [2021, 2022, 2023]
+
+    start = time.time()
+    results = ingest_seasons(seasons, teams, archives=archives)
+    print(len(results), 'games,', sum(count for _, count, _ in results), 'transitions in', round(time.time() - start, 2), 'seconds')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from dataLoader.transitions import STATE_SPACE, ACTION_SPACE
+from dataLoader.encoder import LEGACY_ENCODER
+
+# upper bounds of the to-go buckets; the last bucket is open ended
+DISTANCE_BUCKETS = [3, 6, 10]
+# width of the field-position (yards to endzone) buckets
+FIELD_POSITION_BUCKET_WIDTH = 10
+
+
+def build_payout_tables(data, laplace_prior=1, state_space=STATE_SPACE):
+    """
+    Builds every count and payout table of the logged transitions in one pass
+    of bincounts over the encoded arrays, all in float64.
+
+    Returns
+    payout_table: (S, A) R(s, a) / (N(s, a) + laplace_prior)
+    state_counts: (S,) N(s)
+    state_action_counts: (S, A) N(s, a)
+    """
+    flat_index = np.asarray(data.states) * ACTION_SPACE + np.asarray(data.actions)
+    size = state_space * ACTION_SPACE
+    state_action_counts = np.bincount(flat_index, minlength=size).reshape(state_space, ACTION_SPACE).astype(np.float64)
+    cumulative_rewards = np.bincount(flat_index, weights=data.rewards, minlength=size).reshape(state_space, ACTION_SPACE)
+    state_counts = np.sum(state_action_counts, axis=1)
+    payout_table = cumulative_rewards / (state_action_counts + laplace_prior)
+    return payout_table, state_counts, state_action_counts
+
+
+def distance_bucket_labels(buckets=DISTANCE_BUCKETS):
+    lower = [1] + [b + 1 for b in buckets]
+    return [str(l) + "-" + str(u) for l, u in zip(lower, buckets)] + [str(lower[-1]) + "+"]
+
+
+def grouped_epa(data, buckets=DISTANCE_BUCKETS, fp_width=FIELD_POSITION_BUCKET_WIDTH, encoder=LEGACY_ENCODER):
+    """
+    EPA-EPB aggregates of the logged plays grouped by down, by to-go bucket
+    and by field-position bucket. States are decoded with encoder, so the
+    buckets should be no finer than the encoder's.
+
+    Returns a dict of DataFrames (indexed by group) with count, mean and sum.
+    """
+    curDown, toGo, fp = encoder.decode(data.states)
+    rewards = np.asarray(data.rewards, dtype=np.float64)
+    distance = np.searchsorted(buckets, toGo, side="left")
+    field_position = (fp - 1) // fp_width
+
+    groupings = {
+        "down": (curDown - 1, ["1", "2", "3", "4"]),
+        "distance": (distance, distance_bucket_labels(buckets)),
+        "field position": (
+            field_position,
+            [str(i * fp_width + 1) + "-" + str((i + 1) * fp_width) for i in range(-(-100 // fp_width))],
+        ),
+    }
+    tables = {}
+    for name, (group, labels) in groupings.items():
+        counts = np.bincount(group, minlength=len(labels))
+        sums = np.bincount(group, weights=rewards, minlength=len(labels))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        tables[name] = pd.DataFrame({"count": counts, "mean": means, "sum": sums}, index=pd.Index(labels, name=name))
+    return tables
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+from dataLoader.transitions import Transitions, load_transitions
+from dataLoader.encoder import LEGACY_ENCODER
+
+# where the encoded season arrays are kept
+CACHE_DIR = ".cache/transitions"
+# bump whenever the state encoding or the cache layout changes
+CACHE_VERSION = 2
+# game ids are team number * GAME_ID_TEAM_FACTOR + season * 100 + week
+GAME_ID_TEAM_FACTOR = 10 ** 6
+COLUMNS = ["states", "actions", "rewards", "next_states", "weeks", "games"]
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def week_number(filename):
+    match = re.search(r"week_(\d+)\.csv$", filename)
+    return int(match.group(1)) if match else 0
+
+
+def season_number(folder):
+    match = re.search(r"(\d{4})", os.path.basename(os.path.normpath(folder)))
+    return int(match.group(1)) if match else 0
+
+
+def team_number(folder):
+    """
+    Numeric code of the team of a cleaned folder. The default team's
+    cleaned_YYYY_data folders are 0, so their game ids stay season * 100 +
+    week. The cleaned_YYYY_TEAM_data folders of other teams get the crc32
+    of the team name, which keeps their games apart from the default team's.
+    """
+    match = re.match(r"cleaned_\d{4}_(.+)_data$", os.path.basename(os.path.normpath(folder)))
+    return zlib.crc32(match.group(1).encode()) if match else 0
+
+
+def game_id(folder, week):
+    return team_number(folder) * GAME_ID_TEAM_FACTOR + season_number(folder) * 100 + week
+
+
+def read_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != CACHE_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def update_season_cache(folder, cache_dir=CACHE_DIR, encoder=LEGACY_ENCODER):
+    """
+    Brings the cache of one cleaned season folder up to date and returns its
+    directory. Every encoder gets its own cache, under its key.
+
+    Every weekly csv is encoded once into its own .npz. A week is rebuilt
+    only when its csv changed: the mtime and size are checked first and the
+    sha1 is only computed when they differ. When anything changed, the
+    season-wide .npy column files are rewritten.
+    """
+    season_dir = os.path.join(cache_dir, encoder.key, os.path.basename(os.path.normpath(folder)))
+    os.makedirs(season_dir, exist_ok=True)
+    manifest_path = os.path.join(season_dir, "manifest.json")
+    manifest = read_manifest(manifest_path)
+
+    filenames = sorted(
+        (f for f in os.listdir(folder) if f.endswith(".csv")), key=week_number
+    )
+    updated = {}
+    changed = set(manifest) != set(filenames)
+    for filename in filenames:
+        path = os.path.join(folder, filename)
+        stat = os.stat(path)
+        week_path = os.path.join(season_dir, filename[: -len(".csv")] + ".npz")
+        entry = manifest.get(filename)
+        if (
+            entry is not None
+            and os.path.exists(week_path)
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            updated[filename] = entry
+            continue
+
+        digest = file_hash(path)
+        if entry is None or entry["sha1"] != digest or not os.path.exists(week_path):
+            data = load_transitions(path, encoder)
+            week = week_number(filename)
+            weeks = np.full(len(data.states), week, dtype=np.int64)
+            games = np.full(len(data.states), game_id(folder, week), dtype=np.int64)
+            write_atomic(
+                week_path,
+                lambda f: np.savez(f, *data, weeks, games),
+            )
+            changed = True
+        updated[filename] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": digest,
+        }
+
+    column_paths = [os.path.join(season_dir, name + ".npy") for name in COLUMNS]
+    if changed or not all(os.path.exists(path) for path in column_paths):
+        weekly = []
+        for filename in filenames:
+            week_path = os.path.join(season_dir, filename[: -len(".csv")] + ".npz")
+            with np.load(week_path) as arrays:
+                weekly.append([arrays["arr_%d" % i] for i in range(len(COLUMNS))])
+        for i, path in enumerate(column_paths):
+            if weekly:
+                column = np.concatenate([week[i] for week in weekly])
+            else:
+                column = np.zeros(0, dtype=np.float64 if i == 2 else np.int64)
+            write_atomic(path, lambda f: np.save(f, column))
+        for filename in set(manifest) - set(filenames):
+            stale = os.path.join(season_dir, filename[: -len(".csv")] + ".npz")
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    if updated != manifest:
+        write_atomic(
+            manifest_path,
+            lambda f: f.write(
+                json.dumps({"version": CACHE_VERSION, "files": updated}).encode()
+            ),
+        )
+    return season_dir
+
+
+def load_season(folder, cache_dir=CACHE_DIR, mmap_mode="r", encoder=LEGACY_ENCODER):
+    """
+    Returns the memory-mapped Transitions of a cleaned season folder together
+    with the week and game id of every row. Game ids are season * 100 + week,
+    offset by the team number of folders of other teams (see game_id).
+    """
+    season_dir = update_season_cache(folder, cache_dir, encoder)
+    columns = [
+        np.load(os.path.join(season_dir, name + ".npy"), mmap_mode=mmap_mode)
+        for name in COLUMNS
+    ]
+    return Transitions(*columns[:4]), columns[4], columns[5]
+
+
+def read_data_from_folders(folders, cache_dir=CACHE_DIR, encoder=LEGACY_ENCODER):
+    """
+    Loads every weekly csv of folders through the season caches. Returns the
+    Transitions of all folders in order, plus the week and game id arrays.
+    """
+    seasons = [load_season(folder, cache_dir, encoder=encoder) for folder in folders]
+    if len(seasons) == 1:
+        return seasons[0]
+    data = Transitions(*(np.concatenate(column) for column in zip(*(s[0] for s in seasons))))
+    weeks = np.concatenate([s[1] for s in seasons])
+    games = np.concatenate([s[2] for s in seasons])
+    return data, weeks, games
+
+
+def split_by_game(data, games):
+    """
+    Yields (game id, Transitions) for every game, in stored order.
+    """
+    boundaries = np.flatnonzero(np.diff(games)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(games)]])
+    for start, end in zip(starts, ends):
+        if end > start:
+            yield games[start], Transitions(*(column[start:end] for column in data))
@@ -0,0 +1,86 @@
+import numpy as np
+
+# downs above this are clipped
+MAX_DOWN = 4
+# field positions (yards to the endzone) above this are clipped
+MAX_FIELD_POSITION = 99
+
+
+class StateEncoder:
+    """
+    Encodes (down, toGo, fp) as numerical states on a down x toGo bucket x
+    fp bucket grid, with one extra TERMINAL state after the grid:
+
+        index = ((down - 1) * toGo buckets + toGo bucket) * fp buckets + fp bucket
+
+    togo_edges are the inclusive upper edges of the toGo buckets, and the
+    last bucket is open ended. [3, 6, 10] gives 1-3 / 4-6 / 7-10 / 11+.
+    Field positions go in fp_width yard buckets.
+
+    Every index is shifted by offset and wrapped mod state_space. The
+    legacy encoding is offset -1, where (1, 1, 1) lands on the last index.
+    """
+
+    def __init__(self, togo_edges, fp_width=1, offset=0):
+        self.togo_edges = np.asarray(togo_edges, dtype=np.int64)
+        self.fp_width = int(fp_width)
+        self.offset = int(offset)
+        self.togo_buckets = len(self.togo_edges) + 1
+        self.fp_buckets = -(-100 // self.fp_width)
+        self.terminal_value = MAX_DOWN * self.togo_buckets * self.fp_buckets
+        self.state_space = self.terminal_value + 1
+        self.terminal_state = (self.terminal_value + self.offset) % self.state_space
+
+    @property
+    def key(self):
+        """
+        Short name of the encoding, used to keep caches of different
+        encoders apart.
+        """
+        return "togo{}_fp{}_off{}".format(
+            "-".join(str(edge) for edge in self.togo_edges), self.fp_width, self.offset
+        )
+
+    def togo_lower_edges(self):
+        return np.concatenate([[1], self.togo_edges + 1])
+
+    def encode(self, curDown, toGo, fp, terminal=None):
+        """
+        Encodes (down, toGo, fp) arrays. Rows flagged in terminal map to
+        terminal_state.
+        """
+        curDown = np.minimum(curDown, MAX_DOWN)
+        togo_bucket = np.searchsorted(self.togo_edges, toGo, side="left")
+        fp_bucket = (np.minimum(fp, MAX_FIELD_POSITION) - 1) // self.fp_width
+        numeric = ((curDown - 1) * self.togo_buckets + togo_bucket) * self.fp_buckets + fp_bucket
+        if terminal is not None:
+            numeric = np.where(terminal, self.terminal_value, numeric)
+        return (numeric + self.offset) % self.state_space
+
+    def decode(self, states):
+        """
+        Inverse of encode for non-terminal states. Returns the down and the
+        lower edge of the toGo and fp buckets as int arrays.
+        """
+        numeric = (np.asarray(states) - self.offset) % self.state_space
+        per_down = self.togo_buckets * self.fp_buckets
+        togo_bucket = (numeric % per_down) // self.fp_buckets
+        togo = self.togo_lower_edges()[np.minimum(togo_bucket, self.togo_buckets - 1)]
+        return numeric // per_down + 1, togo, (numeric % self.fp_buckets) * self.fp_width + 1
+
+    def project(self, values, target):
+        """
+        Maps per-state rows (values, policies, ...) of this encoding onto
+        every state of target. Each target state takes the row of the state
+        of this encoding that holds its (down, toGo, fp) bucket lower edges.
+        """
+        if target.key == self.key:
+            return np.asarray(values)
+        target_states = np.arange(target.state_space)
+        curDown, toGo, fp = target.decode(target_states)
+        states = self.encode(curDown, toGo, fp, target_states == target.terminal_state)
+        return np.asarray(values)[states]
+
+
+# the original 1-yard grid: toGo 1..24 and 25+, fp 1..99, 10001 states
+LEGACY_ENCODER = StateEncoder(togo_edges=np.arange(1, 25), fp_width=1, offset=-1)
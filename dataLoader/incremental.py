@@ -0,0 +1,77 @@
+import hashlib
+import os
+
+import numpy as np
+
+from dataLoader.cache import write_atomic, split_by_game
+
+# where the persistent count, value and Q tables are kept between runs
+INCREMENTAL_DIR = ".cache/incremental"
+# bump whenever the layout of a saved state changes
+INCREMENTAL_VERSION = 1
+
+
+def game_digests(data, games):
+    """
+    Returns {game id: sha1 of the game's rows} in stored order, so a saved
+    state can tell which games it has already folded in and whether any of
+    them changed since.
+    """
+    digests = {}
+    for game, rows in split_by_game(data, games):
+        sha1 = hashlib.sha1()
+        for column in rows:
+            sha1.update(np.ascontiguousarray(column).tobytes())
+        digests[int(game)] = sha1.hexdigest()
+    return digests
+
+
+def load_state(name, incremental_dir=INCREMENTAL_DIR):
+    """
+    Returns the arrays saved under name as a dict, or an empty dict when
+    there is no usable saved state.
+    """
+    path = os.path.join(incremental_dir, name + ".npz")
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as arrays:
+        state = {key: arrays[key] for key in arrays.files}
+    if state.get("version") != INCREMENTAL_VERSION:
+        return {}
+    return state
+
+
+def save_state(name, state, incremental_dir=INCREMENTAL_DIR):
+    os.makedirs(incremental_dir, exist_ok=True)
+    path = os.path.join(incremental_dir, name + ".npz")
+    arrays = dict(state, version=INCREMENTAL_VERSION)
+    write_atomic(path, lambda f: np.savez(f, **arrays))
+
+
+def pending_games(state, data, games):
+    """
+    Compares the games folded into a saved state with the current data.
+
+    Returns (new game ids in stored order, digests of all current games,
+    rebuild). rebuild is True when a game that was already folded in changed
+    or disappeared; its old counts cannot be taken back out, so every game
+    is returned as new and the caller has to start from empty tables.
+    """
+    digests = game_digests(data, games)
+    folded = dict(zip(state.get("games", np.zeros(0, dtype=np.int64)).tolist(),
+                      state.get("digests", np.zeros(0, dtype=str)).tolist()))
+    rebuild = any(digests.get(game) != digest for game, digest in folded.items())
+    if rebuild:
+        folded = {}
+    new_games = [game for game in digests if game not in folded]
+    return new_games, digests, rebuild
+
+
+def digest_arrays(digests):
+    """
+    The games and digests entries of a state dict for the given digests.
+    """
+    return {
+        "games": np.array(list(digests), dtype=np.int64),
+        "digests": np.array(list(digests.values()), dtype=str),
+    }
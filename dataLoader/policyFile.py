@@ -0,0 +1,148 @@
+import json
+import os
+
+import numpy as np
+
+from dataLoader.cache import write_atomic
+from dataLoader.encoder import StateEncoder, LEGACY_ENCODER
+
+# first bytes of every binary policy file
+POLICY_MAGIC = b"NFLPOLICY\0"
+# bump whenever the binary layout changes
+POLICY_VERSION = 1
+# the action and value arrays start on multiples of this
+POLICY_ALIGNMENT = 8
+# extension of binary policy files written next to the text ones
+BINARY_POLICY_EXTENSION = ".policy"
+# the text policy modelBased.main writes; the query service serves its binary twin by default
+MODEL_BASED_POLICY_FILE = "results/model_based_test3.csv"
+
+
+def write_policy_file(filename, policy):
+    """
+    Writes a one-indexed policy as one action per line, the format
+    tester.get_policy_table has always read.
+    """
+    with open(filename, "w") as f:
+        for i in range(len(policy)):
+            f.write(str(int(policy[i])) + "\n")
+
+
+def binary_policy_path(filename):
+    return os.path.splitext(filename)[0] + BINARY_POLICY_EXTENSION
+
+
+def _aligned(offset):
+    return -(-offset // POLICY_ALIGNMENT) * POLICY_ALIGNMENT
+
+
+# offsets of the action and value arrays after a header of header_length bytes
+def _offsets(header_length, state_space):
+    actions_offset = _aligned(len(POLICY_MAGIC) + 4 + header_length)
+    return actions_offset, _aligned(actions_offset + state_space)
+
+
+def write_binary_policy(filename, policy, value_table=None, encoder=LEGACY_ENCODER, **metadata):
+    """
+    Writes a one-indexed policy and its value table in the binary layout
+
+        POLICY_MAGIC | uint32 header length | JSON header | pad
+        uint8 actions[state_space] | pad | float64 values[state_space]
+
+    The header records the encoding, so readers can encode raw
+    (down, toGo, fp) queries the same way, and any extra metadata (gamma,
+    data range, solver, ...). Missing values are stored as NaN.
+    """
+    actions = np.ravel(policy).astype(np.uint8)
+    values = np.full(len(actions), np.nan) if value_table is None else np.ravel(value_table).astype(np.float64)
+    if len(actions) != encoder.state_space or len(values) != encoder.state_space:
+        raise ValueError("policy and value table need one row per state of the encoder")
+
+    header = {
+        "version": POLICY_VERSION,
+        "encoding": {
+            "togo_edges": encoder.togo_edges.tolist(),
+            "fp_width": encoder.fp_width,
+            "offset": encoder.offset,
+            "key": encoder.key,
+        },
+        "state_space": encoder.state_space,
+        "metadata": metadata,
+    }
+    encoded = json.dumps(header, sort_keys=True).encode()
+    prefix = len(POLICY_MAGIC) + 4 + len(encoded)
+    actions_offset, values_offset = _offsets(len(encoded), len(actions))
+
+    def write(f):
+        f.write(POLICY_MAGIC)
+        f.write(np.uint32(len(encoded)).tobytes())
+        f.write(encoded)
+        f.write(bytes(actions_offset - prefix))
+        f.write(actions.tobytes())
+        f.write(bytes(values_offset - actions_offset - len(actions)))
+        f.write(values.tobytes())
+
+    write_atomic(filename, write)
+
+
+def is_binary_policy(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(POLICY_MAGIC)) == POLICY_MAGIC
+
+
+def read_binary_policy(filename, mmap_mode="r"):
+    """
+    Reads a binary policy file. The action and value arrays are memory
+    mapped (mmap_mode=None loads them instead).
+
+    Returns (header, StateEncoder of the file, one-indexed uint8 actions,
+    float64 values).
+    """
+    with open(filename, "rb") as f:
+        if f.read(len(POLICY_MAGIC)) != POLICY_MAGIC:
+            raise ValueError(filename + " is not a binary policy file")
+        length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(length))
+    if header["version"] != POLICY_VERSION:
+        raise ValueError("unsupported policy file version " + str(header["version"]))
+
+    encoding = header["encoding"]
+    encoder = StateEncoder(encoding["togo_edges"], encoding["fp_width"], encoding["offset"])
+    state_space = header["state_space"]
+    actions_offset, values_offset = _offsets(length, state_space)
+    if mmap_mode is None:
+        with open(filename, "rb") as f:
+            f.seek(actions_offset)
+            actions = np.fromfile(f, dtype=np.uint8, count=state_space)
+            f.seek(values_offset)
+            values = np.fromfile(f, dtype=np.float64, count=state_space)
+    else:
+        actions = np.memmap(filename, dtype=np.uint8, mode=mmap_mode, offset=actions_offset, shape=(state_space,))
+        values = np.memmap(filename, dtype=np.float64, mode=mmap_mode, offset=values_offset, shape=(state_space,))
+    return header, encoder, actions, values
+
+
+def read_policy(filename):
+    """
+    Reads a one-indexed policy on the legacy grid from either format.
+    Binary policies on another grid are projected onto it.
+    """
+    if is_binary_policy(filename):
+        header, encoder, actions, values = read_binary_policy(filename)
+        return encoder.project(np.asarray(actions, dtype=np.int64), LEGACY_ENCODER)
+    return np.loadtxt(filename, dtype=np.int64, ndmin=1)
+
+
+def data_range(folders, games):
+    """
+    Metadata on the data a policy was trained on, for the binary header.
+    Game ids are cache.game_id values, season * 100 + week for the default
+    team.
+    """
+    return {
+        "folders": list(folders),
+        "first_game": int(np.min(games)),
+        "last_game": int(np.max(games)),
+        "games": int(len(np.unique(games))),
+        "transitions": int(len(games)),
+    }
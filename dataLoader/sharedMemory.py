@@ -0,0 +1,64 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from dataLoader.transitions import Transitions
+
+
+def share_arrays(arrays):
+    """
+    Copies a dict of arrays into shared memory blocks.
+
+    Returns (blocks, spec). The parent keeps blocks alive and hands them to
+    release_arrays when done. spec is a small picklable
+    {name: (block name, shape, dtype)} that workers pass to attach_arrays.
+    """
+    blocks, spec = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def attach_arrays(spec):
+    """
+    Maps the blocks described by spec without copying them.
+    Returns (blocks, {name: read-only array}). The blocks have to stay
+    referenced as long as the arrays are used.
+    """
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[name] = array
+    return blocks, arrays
+
+
+def release_arrays(blocks, unlink=True):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def share_transitions(data, **columns):
+    """
+    share_arrays for Transitions plus any extra per-row columns (weeks,
+    games, ...).
+    """
+    return share_arrays(dict(data._asdict(), **columns))
+
+
+def attach_transitions(spec):
+    """
+    Returns (blocks, Transitions, {name: extra column}) for a spec from
+    share_transitions.
+    """
+    blocks, arrays = attach_arrays(spec)
+    data = Transitions(*(arrays.pop(name) for name in Transitions._fields))
+    return blocks, data, arrays
@@ -0,0 +1,77 @@
+import numpy as np
+
+from dataLoader.transitions import Transitions
+from dataLoader.encoder import LEGACY_ENCODER
+
+
+class StateIndex:
+    """
+    Dense index over the encoded states that actually appear in the data,
+    as s or as s'. Solvers run on the compact index 0..size-1 and the
+    results are expanded back to all encoder.state_space rows for policy
+    files.
+
+    Note that a Laplace-smoothed model on the compact space spreads its
+    uniform part over the size indexed states instead of every encoded
+    state.
+    """
+
+    def __init__(self, states, encoder=LEGACY_ENCODER):
+        # sorted encoded state of every compact index
+        self.states = np.unique(np.asarray(states, dtype=np.int64))
+        self.encoder = encoder
+        self.state_space = encoder.state_space
+        self.size = len(self.states)
+
+    @classmethod
+    def from_transitions(cls, data, encoder=LEGACY_ENCODER):
+        return cls(np.concatenate([data.states, data.next_states]), encoder)
+
+    def compact(self, states):
+        """
+        Maps encoded states to their compact index. Every state has to be in
+        the index.
+        """
+        return np.searchsorted(self.states, states)
+
+    def compact_transitions(self, data):
+        return Transitions(
+            self.compact(data.states), np.asarray(data.actions),
+            np.asarray(data.rewards), self.compact(data.next_states),
+        )
+
+    def contains(self, states):
+        position = np.minimum(np.searchsorted(self.states, states), self.size - 1)
+        return self.states[position] == states
+
+    def expand(self, compact_values, fill_value=0):
+        """
+        Scatters per-index rows (values, Q rows, ...) back onto all encoded
+        states. States that are not in the index get fill_value.
+        """
+        compact_values = np.asarray(compact_values)
+        full = np.full((self.state_space,) + compact_values.shape[1:], fill_value, dtype=compact_values.dtype)
+        full[self.states] = compact_values
+        return full
+
+    def expand_policy(self, compact_policy):
+        """
+        Expands a compact policy to all encoded states. A state that is not
+        in the index takes the most common action among the indexed states
+        with the same down, or the most common action overall when none of
+        them shares its down. TERMINAL is not counted for either.
+        """
+        compact_policy = np.asarray(compact_policy).astype(np.int64)
+        observed = self.states != self.encoder.terminal_state
+        overall = np.argmax(np.bincount(compact_policy[observed]))
+        fallback = np.full(self.state_space, overall)
+
+        curDown = self.encoder.decode(np.arange(self.state_space))[0]
+        observed_downs = self.encoder.decode(self.states[observed])[0]
+        for down in np.unique(observed_downs):
+            actions = compact_policy[observed][observed_downs == down]
+            fallback[curDown == down] = np.argmax(np.bincount(actions))
+
+        full = fallback.copy()
+        full[self.states] = compact_policy
+        return full
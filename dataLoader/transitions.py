@@ -0,0 +1,78 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from dataLoader.encoder import LEGACY_ENCODER
+
+# to denote s numerical value for terminal state
+TERMINAL_STATE_VALUE = 10000
+# size of state space (+1 to accommodate for terminal state)
+STATE_SPACE = 10001
+# size of action space
+ACTION_SPACE = 4
+# zero-indexed numerical state of TERMINAL after encoding
+TERMINAL_STATE = (TERMINAL_STATE_VALUE - 1) % STATE_SPACE
+
+# encoded, zero-indexed transitions, one array per column
+Transitions = namedtuple("Transitions", ["states", "actions", "rewards", "next_states"])
+
+STATE_PATTERN = r"\[\s*(-?\d+)\s*,\s*(-?\d+)\s*,\s*(-?\d+)\s*\]"
+
+
+def parse_state_column(column):
+    """
+    Parses a column of "[down, toGo, fp]" strings without evaluating each cell.
+    Terminal cells (the "['T', 'E', 'R', ...]" lists written by csvParser) do
+    not match the pattern.
+
+    Returns down, toGo, fp int arrays and a boolean terminal mask. The
+    down/toGo/fp entries of terminal rows are 1.
+    """
+    parts = column.astype(str).str.extract(STATE_PATTERN)
+    terminal = parts[0].isna().to_numpy()
+    parts = parts.fillna(1).astype(np.int64).to_numpy()
+    return parts[:, 0], parts[:, 1], parts[:, 2], terminal
+
+
+def load_transitions(inputfilepath, encoder=LEGACY_ENCODER):
+    """
+    Returns None if inputfilepath does not exist
+    Returns Transitions with int64 states, actions, next states and float64 rewards
+    Zero-indexes states, action, new states, with states encoded by encoder
+    """
+    # check if path exists
+    if not os.path.exists(inputfilepath):
+        return None
+
+    df = pd.read_csv(inputfilepath, sep=";")
+    curDown, toGo, fp, terminal = parse_state_column(df["State"])
+    states = encoder.encode(curDown, toGo, fp, terminal)
+    curDown, toGo, fp, terminal = parse_state_column(df["Next_State"])
+    next_states = encoder.encode(curDown, toGo, fp, terminal)
+
+    return Transitions(
+        states,
+        df["Action"].to_numpy(dtype=np.int64) - 1,
+        df["Reward"].to_numpy(dtype=np.float64),
+        next_states,
+    )
+
+
+def drive_ids(data, encoder=LEGACY_ENCODER):
+    """
+    Numbers the drives of concatenated Transitions. csvParser marks the last
+    play of every drive (and of every game) with a TERMINAL next state, so a
+    new drive starts on the row after each terminal one.
+    """
+    ends = data.next_states == encoder.terminal_state
+    return np.concatenate([[0], np.cumsum(ends[:-1])]).astype(np.int64)
+
+
+def decode_states(states, encoder=LEGACY_ENCODER):
+    """
+    Inverse of encoder.encode for non-terminal states.
+    Returns down, toGo, fp int arrays.
+    """
+    return encoder.decode(states)
@@ -1,135 +1,681 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
-import ast
 import random
+import time
+import heapq
+from scipy import sparse
+from scipy.sparse import linalg as splinalg
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.aggregates import build_payout_tables
+from dataLoader.transitions import Transitions
+from dataLoader.incremental import load_state, save_state, pending_games, digest_arrays
+from dataLoader.stateIndex import StateIndex
+from dataLoader.encoder import StateEncoder, LEGACY_ENCODER
+from dataLoader.policyFile import (
+    write_policy_file,
+    write_binary_policy,
+    binary_policy_path,
+    data_range,
+    MODEL_BASED_POLICY_FILE,
+)
 
-TERMINAL_STATE_VALUE = 10000
 STATE_SPACE = 10001
 ACTION_SPACE = 4
 GAMMA = 0.95
 VALUE_ITERATION_THRESHOLD = 0.1
+# True sweeps the states in place (Gauss-Seidel), False runs one batched
+# Jacobi backup over all states per sweep
+GAUSS_SEIDEL = True
+# states backed up together, as one batched backup, by an in-place sweep;
+# 1 goes state by state and only reproduces the original loop's trace
+GAUSS_SEIDEL_BLOCK_SIZE = 500
+# "value_iteration", "policy_iteration" or "prioritized_sweeping"
+SOLVER = "value_iteration"
+# report both solvers side by side before writing the policy
+COMPARE_SOLVERS = False
+# fold only new games into the saved counts and warm-start from the saved values
+INCREMENTAL = False
+# solve on the states seen in the data only, then expand the policy to STATE_SPACE rows
+COMPACT_STATES = False
+# grid the policy is solved on; policy files are always written on the legacy grid
+ENCODER = LEGACY_ENCODER
+# solve on COARSE_ENCODER first and warm-start the ENCODER solve from its values
+COARSE_TO_FINE = False
+COARSE_ENCODER = StateEncoder(togo_edges=[3, 6, 10], fp_width=5)
+# also write the policy and values as a binary policy file on the ENCODER grid
+WRITE_BINARY_POLICY = True
+
+
+class TransitionModel:
+    """
+    Sparse Laplace-smoothed transition model.
+
+    Only the observed (s, a, s') counts are stored, one sparse (S, S) count
+    matrix per action. The Laplace constant is applied analytically:
+
+        T(s' | s, a) = (N(s, a, s') + c) / (N(s, a) + S * c)
+
+    so the smoothed (S, A, S) tensor is never materialized.
+    """
+
+    def __init__(self, counts, visit_count, laplace_constant=1):
+        # counts[a] is a csr matrix with N(s, a, s') at row s, column s'
+        self.counts = counts
+        # N(s, a)
+        self.visit_count = visit_count
+        self.laplace_constant = laplace_constant
+        self.state_space, self.action_space = visit_count.shape
+
+    @property
+    def denominator(self):
+        # N(s, a) + S * c, the normalizer of every smoothed row
+        return self.visit_count + self.state_space * self.laplace_constant
+
+    def expected_next_values(self, value_table, states=None):
+        """
+        Returns the (S, A) array of E[V(s') | s, a] under the smoothed model,
+        or only the rows in states (a slice or index array) when given.
+        """
+        if states is None:
+            states = slice(None)
+        smoothing = self.laplace_constant * np.sum(value_table)
+        expected = np.column_stack(
+            [self.counts[a][states] @ value_table for a in range(self.action_space)]
+        )
+        return (expected + smoothing) / self.denominator[states]
+
+    def update(self, data):
+        """
+        Folds the counts of new transitions into the model in place, so a new
+        week costs one sparse addition per action instead of a full rebuild.
+        """
+        counts = transition_counts(data, self.state_space)
+        self.counts = [self.counts[a] + counts[a] for a in range(self.action_space)]
+        flat_index = np.asarray(data.states) * self.action_space + np.asarray(data.actions)
+        self.visit_count = self.visit_count + np.bincount(
+            flat_index, minlength=self.state_space * self.action_space
+        ).reshape(self.state_space, self.action_space)
+
+    def probabilities(self, state, action):
+        """
+        Returns the dense smoothed distribution T(. | state, action).
+        """
+        row = self.counts[action].getrow(state).toarray().ravel()
+        return (row + self.laplace_constant) / self.denominator[state, action]
+
+    def todense(self):
+        """
+        Materializes the full (S, A, S) transition tensor. Only meant for
+        small state spaces.
+        """
+        dense = np.empty((self.state_space, self.action_space, self.state_space))
+        for a in range(self.action_space):
+            dense[:, a, :] = self.counts[a].toarray() + self.laplace_constant
+        return dense / self.denominator[:, :, None]
+
+
+def transition_counts(data, state_space=STATE_SPACE):
+    """
+    Returns one csr matrix of N(s, a, s') counts per action.
+    """
+    states, actions, rewards, next_states = data
+
+    counts = []
+    for a in range(ACTION_SPACE):
+        mask = actions == a
+        counts.append(
+            sparse.csr_matrix(
+                (np.ones(np.count_nonzero(mask)), (states[mask], next_states[mask])),
+                shape=(state_space, state_space),
+            )
+        )
+    return counts
 
 
-def parse_data(inputfilepath):
-    df = pd.read_csv(inputfilepath, sep=";")
-    df["State"] = df["State"].apply(ast.literal_eval)
-    df["Next_State"] = df["Next_State"].apply(ast.literal_eval)
-
-    # Convert states to numerical values
-    for i in range(len(df)):
-        state = df.loc[i, "State"]
-        next_state = df.loc[i, "Next_State"]
-
-        # Handle terminal state separately
-        if next_state[0] == "T":
-            df.loc[i, "Next_State"] = TERMINAL_STATE_VALUE
-        else:
-            df.loc[i, "Next_State"] = state_to_numeric(next_state)
-
-        df.loc[i, "State"] = state_to_numeric(state)
-
-    df["State"] -= 1
-    df["Next_State"] -= 1
-    df["Action"] -= 1
-
-    return df
-
+def estimate_transition_and_reward_matrices(
+    data, laplace_constant=1, state_space=STATE_SPACE
+):
+    counts = transition_counts(data, state_space)
 
-def state_to_numeric(state):
-    curDown, toGo, fp = (
-        min(int(state[0]), 4),
-        min(int(state[1]), 25),
-        min(int(state[2]), 100),
+    # Average rewards, with the same Laplace adjusted divisor as the
+    # transition rows: (N + S * c) - (S - 1) * c = N + c
+    reward_matrix, state_counts, visit_count = build_payout_tables(
+        data, laplace_constant, state_space
     )
-    assert curDown <= 4 and toGo <= 25 and fp <= 100
-    return 100 * (toGo - 1) + 2500 * (curDown - 1) + (fp - 1)
-
-
-def estimate_transition_and_reward_matrices(data, laplace_constant=1):
-    transition_matrix = np.zeros((STATE_SPACE, ACTION_SPACE, STATE_SPACE))
-    reward_matrix = np.zeros((STATE_SPACE, ACTION_SPACE))
-    visit_count = np.zeros((STATE_SPACE, ACTION_SPACE))
-
-    for state, action, reward, next_state in data:
-        transition_matrix[state, action, next_state] += 1
-        reward_matrix[state, action] += reward
-        visit_count[state, action] += 1
-
-    # Apply Laplace smoothing
-    transition_matrix += laplace_constant
-    visit_count += (
-        STATE_SPACE * laplace_constant
-    )  # Adjusted for each possible next state
-
-    # Normalize to get probabilities and average rewards
-    for s in range(STATE_SPACE):
-        for a in range(ACTION_SPACE):
-            transition_matrix[s, a, :] /= visit_count[s, a]
-            reward_matrix[s, a] /= (
-                visit_count[s, a] - (STATE_SPACE - 1) * laplace_constant
-            )  # Adjusting the divisor for added constants
-
-    return transition_matrix, reward_matrix
-
 
-def value_iteration(transition_matrix, reward_matrix):
-    value_table = np.zeros(STATE_SPACE)
-    policy = np.zeros(STATE_SPACE)
+    transition_model = TransitionModel(counts, visit_count, laplace_constant)
+    return transition_model, reward_matrix
+
+
+def bellman_backup(transition_model, reward_matrix, value_table, gamma=GAMMA, states=None):
+    """
+    Batched Bellman backup Q(s, a) = R(s, a) + gamma * E[V(s') | s, a] for all
+    states (or only the rows in states) and all actions at once.
+
+    transition_model is either a TransitionModel or a dense (S, A, S) array.
+    """
+    if states is None:
+        states = slice(None)
+    if isinstance(transition_model, np.ndarray):
+        expected = transition_model[states] @ value_table
+    else:
+        expected = transition_model.expected_next_values(value_table, states)
+    return reward_matrix[states] + gamma * expected
+
+
+def in_place_sweep(transition_model, reward_matrix, value_table, policy, gamma=GAMMA):
+    """
+    Backs up the states one at a time in state order, updating value_table
+    and policy in place, so every state already sees the new values of the
+    states before it. This is the original per-state loop, reading the csr
+    rows directly and keeping a running sum of the values for the smoothing
+    term instead of touching a dense (A, S) slice per state.
+    """
+    model = transition_model
+    c = model.laplace_constant
+    denominator = model.denominator
+    rows = [(counts.indptr, counts.indices, counts.data) for counts in model.counts]
+    total = np.sum(value_table)
+    for s in range(len(value_table)):
+        best, best_action = -np.inf, 0
+        for a, (indptr, indices, data) in enumerate(rows):
+            start, end = indptr[s], indptr[s + 1]
+            expected = c * total
+            if end > start:
+                expected += data[start:end] @ value_table[indices[start:end]]
+            q = reward_matrix[s, a] + gamma * expected / denominator[s, a]
+            if q > best:
+                best, best_action = q, a
+        total += best - value_table[s]
+        value_table[s] = best
+        policy[s] = best_action + 1
+
+
+def value_iteration(
+    transition_model,
+    reward_matrix,
+    gamma=GAMMA,
+    threshold=VALUE_ITERATION_THRESHOLD,
+    gauss_seidel=GAUSS_SEIDEL,
+    block_size=GAUSS_SEIDEL_BLOCK_SIZE,
+    value_table=None,
+    history=None,
+):
+    """
+    Runs value iteration until the largest value change of a sweep drops
+    below threshold. Returns the one-indexed policy and the value table.
+
+    With gauss_seidel the sweep walks the states in blocks of block_size
+    and updates the value table in place, so later blocks already see the
+    new values. Every block is one batched backup. A block size of 1 runs
+    the original state by state sweep, which is only meant for reproducing
+    its convergence trace. Without gauss_seidel every sweep is one batched
+    (Jacobi) backup over all states.
+    Passing value_table warm-starts the solve, and the max change of every
+    sweep is appended to history when a list is given.
+    """
+    state_space = reward_matrix.shape[0]
+    if value_table is None:
+        value_table = np.zeros(state_space)
+    value_table = np.array(value_table, dtype=np.float64)
+    policy = np.zeros(state_space)
 
     while True:
         value_table_prev = np.copy(value_table)
-        for s in range(STATE_SPACE):
-            U_value = reward_matrix[s, :] + GAMMA * np.sum(
-                transition_matrix[s, :, :] * (value_table),
-                axis=1,
+        if gauss_seidel and block_size == 1 and isinstance(transition_model, TransitionModel):
+            in_place_sweep(transition_model, reward_matrix, value_table, policy, gamma)
+        elif gauss_seidel:
+            for start in range(0, state_space, block_size):
+                block = slice(start, min(start + block_size, state_space))
+                U_value = bellman_backup(
+                    transition_model, reward_matrix, value_table, gamma, block
+                )
+                value_table[block] = np.max(U_value, axis=1)
+                policy[block] = np.argmax(U_value, axis=1) + 1
+        else:
+            U_value = bellman_backup(
+                transition_model, reward_matrix, value_table, gamma
             )
-            value_table[s] = np.max(U_value)
-            policy[s] = np.argmax(U_value) + 1
-
-        print(np.max(np.abs(value_table - value_table_prev)))
-        if np.max(np.abs(value_table - value_table_prev)) < VALUE_ITERATION_THRESHOLD:
+            value_table = np.max(U_value, axis=1)
+            policy = np.argmax(U_value, axis=1) + 1
+
+        delta = np.max(np.abs(value_table - value_table_prev))
+        print(delta)
+        if history is not None:
+            history.append(delta)
+        if delta < threshold:
             break
 
-    return policy
-
+    return policy, value_table
+
+
+def prioritized_sweeping(
+    transition_model,
+    reward_matrix,
+    gamma=GAMMA,
+    threshold=VALUE_ITERATION_THRESHOLD,
+    value_table=None,
+    history=None,
+):
+    """
+    Prioritized sweeping on a TransitionModel. Returns the one-indexed policy
+    and the value table, like value_iteration.
+
+    States that were never visited have only the Laplace part in their rows,
+    so their values are V(u) = max_a R(u, a) + gamma * mean(V). They are
+    solved in closed form from the sum of the visited values instead of being
+    backed up. Every visited state is backed up individually, highest
+    Bellman error first, from a priority queue. When a value changes, its
+    observed predecessors (from the reverse adjacency of the counts) are
+    queued with priority gamma * |change| * max_a T(s | p, a).
+
+    The Laplace term also couples every state to sum(V), which no
+    predecessor index can follow. A batched check sweep over the visited
+    states runs whenever the queue is empty. It reseeds the queue with every
+    residual above threshold and ends the solve when there is none. The max
+    residual of every check sweep is appended to history when a list is
+    given, and the number of single state backups is printed at the end.
+    """
+    model = transition_model
+    state_space, action_space = reward_matrix.shape
+    c = model.laplace_constant
+    denominator = model.denominator
+    visited = np.flatnonzero(np.sum(model.visit_count, axis=1) > 0)
+    unvisited = np.ones(state_space, dtype=bool)
+    unvisited[visited] = False
+    number_unvisited = np.count_nonzero(unvisited)
+
+    # work holds V on visited states and max_a R(u, a) on unvisited ones, so
+    # the true values are work + gamma * mean(V) on the unvisited states
+    work = np.max(reward_matrix, axis=1)
+    if value_table is not None:
+        work[visited] = value_table[visited]
+    work_sum = np.sum(work)
+    # count mass of every (s, a) row that lands on unvisited states
+    unvisited_mass = [model.counts[a] @ unvisited.astype(np.float64) for a in range(action_space)]
+    # influence[s, p] = max_a N(p, a, s) / (N(p, a) + S * c)
+    influence = None
+    for a in range(action_space):
+        scaled = sparse.diags(1.0 / denominator[:, a]) @ model.counts[a]
+        influence = scaled if influence is None else influence.maximum(scaled)
+    influence = influence.T.tocsr()
+
+    def backup(states):
+        mean_value = work_sum / (state_space - gamma * number_unvisited)
+        expected = np.column_stack(
+            [
+                model.counts[a][states] @ work + gamma * mean_value * unvisited_mass[a][states]
+                for a in range(action_space)
+            ]
+        )
+        expected = (expected + c * state_space * mean_value) / denominator[states]
+        return reward_matrix[states] + gamma * expected
+
+    def backup_state(s):
+        # the same backup for one state, reading the csr rows directly
+        mean_value = work_sum / (state_space - gamma * number_unvisited)
+        best = -np.inf
+        for a in range(action_space):
+            counts = model.counts[a]
+            start, end = counts.indptr[s], counts.indptr[s + 1]
+            expected = (
+                counts.data[start:end] @ work[counts.indices[start:end]]
+                + gamma * mean_value * unvisited_mass[a][s]
+                + c * state_space * mean_value
+            )
+            best = max(best, reward_matrix[s, a] + gamma * expected / denominator[s, a])
+        return best
 
-def read_data_from_folders(folders):
-    all_data = []
-    count = 0
-    for folder in folders:
-        for filename in os.listdir(folder):
-            if filename.endswith(".csv"):
-                filepath = os.path.join(folder, filename)
-                file_data = parse_data(filepath)
-                all_data.append(file_data)
-                count += 1
-    return pd.concat(all_data, ignore_index=True).to_numpy()
+    priority = np.zeros(state_space)
+    backups = 0
+    while True:
+        U_value = backup(visited)
+        backups += len(visited)
+        residual = np.abs(np.max(U_value, axis=1) - work[visited])
+        if history is not None:
+            history.append(np.max(residual, initial=0.0))
+        if np.max(residual, initial=0.0) < threshold:
+            break
+        queue = [(-r, s) for r, s in zip(residual, visited) if r >= threshold]
+        priority[visited] = np.where(residual >= threshold, residual, 0.0)
+        heapq.heapify(queue)
+
+        while queue:
+            negative_priority, s = heapq.heappop(queue)
+            if -negative_priority != priority[s]:
+                # an outdated entry, the state was queued again since
+                continue
+            priority[s] = 0.0
+            new_value = backup_state(s)
+            backups += 1
+            change = new_value - work[s]
+            work[s] = new_value
+            work_sum += change
+
+            start, end = influence.indptr[s], influence.indptr[s + 1]
+            for p, weight in zip(influence.indices[start:end], influence.data[start:end]):
+                estimate = gamma * abs(change) * weight
+                if estimate >= threshold and estimate > priority[p]:
+                    priority[p] = estimate
+                    heapq.heappush(queue, (-estimate, p))
+
+    print(backups, "backups")
+    mean_value = work_sum / (state_space - gamma * number_unvisited)
+    value_table = work + gamma * mean_value * unvisited
+    policy = np.argmax(reward_matrix, axis=1) + 1
+    policy[visited] = np.argmax(U_value, axis=1) + 1
+    return policy, value_table
+
+
+def policy_evaluation(transition_model, reward_matrix, policy, gamma=GAMMA):
+    """
+    Evaluates a zero-indexed policy exactly by solving (I - gamma P_pi) V = R_pi.
+
+    For a TransitionModel, P_pi is the sparse count part D^-1 C_pi plus the
+    rank-one Laplace term (c / d) 1^T. The sparse part is factorized once and
+    the rank-one term is folded in with the Sherman-Morrison formula.
+    """
+    state_space = reward_matrix.shape[0]
+    rows = np.arange(state_space)
+    reward_pi = reward_matrix[rows, policy]
+
+    if isinstance(transition_model, np.ndarray):
+        transition_pi = transition_model[rows, policy, :]
+        return np.linalg.solve(np.eye(state_space) - gamma * transition_pi, reward_pi)
+
+    denominator_pi = transition_model.denominator[rows, policy]
+    counts_pi = sparse.csr_matrix((state_space, state_space))
+    for a in range(transition_model.action_space):
+        selected = sparse.diags((policy == a).astype(np.float64))
+        counts_pi = counts_pi + selected @ transition_model.counts[a]
+    system = sparse.identity(state_space, format="csc") - gamma * (
+        sparse.diags(1.0 / denominator_pi) @ counts_pi
+    ).tocsc()
+    smoothing = gamma * transition_model.laplace_constant / denominator_pi
+
+    solver = splinalg.splu(system)
+    x = solver.solve(reward_pi)
+    y = solver.solve(smoothing)
+    return x + y * np.sum(x) / (1 - np.sum(y))
+
+
+def policy_iteration(
+    transition_model,
+    reward_matrix,
+    gamma=GAMMA,
+    policy=None,
+    max_iterations=100,
+    history=None,
+):
+    """
+    Alternates exact policy evaluation with greedy policy improvement until
+    the policy stops changing or max_iterations runs out. Returns the
+    one-indexed policy and its value table, like value_iteration. The
+    number of changed actions per iteration is appended to history when a
+    list is given.
+    """
+    state_space = reward_matrix.shape[0]
+    if policy is None:
+        policy = np.argmax(reward_matrix, axis=1)
+
+    for _ in range(max_iterations):
+        value_table = policy_evaluation(transition_model, reward_matrix, policy, gamma)
+        U_value = bellman_backup(transition_model, reward_matrix, value_table, gamma)
+        new_policy = np.argmax(U_value, axis=1)
+        # keep the current action on ties so the iteration cannot cycle
+        rows = np.arange(state_space)
+        ties = U_value[rows, policy] >= U_value[rows, new_policy] - 1e-12
+        new_policy[ties] = policy[ties]
+
+        changed = np.count_nonzero(new_policy != policy)
+        print(changed)
+        if history is not None:
+            history.append(changed)
+        if changed == 0:
+            break
+        policy = new_policy
+    else:
+        # out of iterations: evaluate the last improved policy, so the
+        # returned values belong to the returned policy
+        value_table = policy_evaluation(transition_model, reward_matrix, policy, gamma)
+
+    return policy + 1, value_table
+
+
+def compare_solvers(transition_model, reward_matrix):
+    """
+    Solves the same model with value iteration, policy iteration and
+    prioritized sweeping and reports wall-clock time, iteration (or check
+    sweep) counts and each policy's agreement with policy iteration.
+    """
+    results = {}
+    for name, solver in [
+        ("value iteration", value_iteration),
+        ("policy iteration", policy_iteration),
+        ("prioritized sweeping", prioritized_sweeping),
+    ]:
+        history = []
+        start = time.time()
+        policy, value_table = solver(transition_model, reward_matrix, history=history)
+        results[name] = (policy, value_table, time.time() - start, len(history))
+
+    for name, (policy, value_table, seconds, iterations) in results.items():
+        print(name + ":", iterations, "iterations,", round(seconds, 3), "seconds")
+    pi_policy, pi_values = results["policy iteration"][:2]
+    for name in ["value iteration", "prioritized sweeping"]:
+        policy, value_table = results[name][:2]
+        print(name, "policy agreement:", np.mean(policy == pi_policy))
+        print(name, "max value difference:", np.max(np.abs(value_table - pi_values)))
+    return results
+
+
+def update_incremental_model(
+    data, games, laplace_constant=1, state_space=STATE_SPACE, name="model_based"
+):
+    """
+    Loads the saved model state and folds in only the games of data it has
+    not seen yet. Starts from empty counts when there is no saved state or
+    when an already folded game changed.
+
+    Returns the transition model, the reward matrix, the state dict (with
+    the previous value_table and policy when there are any) and the number
+    of newly folded transitions.
+    """
+    state = load_state(name)
+    if state and (
+        int(state["state_space"]) != state_space
+        or float(state["laplace_constant"]) != laplace_constant
+    ):
+        state = {}
+    new_games, digests, rebuild = pending_games(state, data, games)
+    if rebuild:
+        state = {}
+
+    if state:
+        counts = []
+        for a in range(ACTION_SPACE):
+            mask = state["count_actions"] == a
+            counts.append(
+                sparse.csr_matrix(
+                    (
+                        state["count_values"][mask],
+                        (state["count_states"][mask], state["count_next_states"][mask]),
+                    ),
+                    shape=(state_space, state_space),
+                )
+            )
+        visit_count = state["visit_count"]
+        reward_sums = state["reward_sums"]
+    else:
+        counts = [sparse.csr_matrix((state_space, state_space)) for _ in range(ACTION_SPACE)]
+        visit_count = np.zeros((state_space, ACTION_SPACE))
+        reward_sums = np.zeros((state_space, ACTION_SPACE))
+    transition_model = TransitionModel(counts, visit_count, laplace_constant)
+
+    rows = np.isin(games, new_games)
+    new_data = Transitions(*(np.asarray(column)[rows] for column in data))
+    transition_model.update(new_data)
+    reward_sums = reward_sums + np.bincount(
+        new_data.states * ACTION_SPACE + new_data.actions,
+        weights=new_data.rewards,
+        minlength=state_space * ACTION_SPACE,
+    ).reshape(state_space, ACTION_SPACE)
+    # same Laplace adjusted divisor as estimate_transition_and_reward_matrices
+    reward_matrix = reward_sums / (transition_model.visit_count + laplace_constant)
+
+    state.update(digest_arrays(digests))
+    state.update(
+        state_space=state_space,
+        laplace_constant=laplace_constant,
+        reward_sums=reward_sums,
+    )
+    return transition_model, reward_matrix, state, int(np.count_nonzero(rows))
+
+
+def save_incremental_model(transition_model, state, value_table, policy, name="model_based"):
+    """
+    Saves the counts of transition_model together with the solved value
+    table and one-indexed policy, for the next update_incremental_model.
+    """
+    triplets = []
+    for a in range(transition_model.action_space):
+        counts = transition_model.counts[a].tocoo()
+        triplets.append(
+            (np.full(counts.nnz, a), counts.row, counts.col, counts.data)
+        )
+    arrays = dict(state, visit_count=transition_model.visit_count,
+                  value_table=value_table, policy=policy)
+    for column_name, columns in zip(
+        ["count_actions", "count_states", "count_next_states", "count_values"],
+        zip(*triplets),
+    ):
+        arrays[column_name] = np.concatenate(columns)
+    save_state(name, arrays)
+
+
+def coarse_warm_start(
+    folders,
+    fine_encoder,
+    coarse_encoder,
+    laplace_constant=1,
+    fine_state_space=None,
+    threshold=VALUE_ITERATION_THRESHOLD,
+):
+    """
+    Solves the MDP on coarse_encoder's grid with value iteration and
+    projects its value table and zero-indexed policy onto every state of
+    fine_encoder, as a warm start for the fine solve.
+
+    The coarse Laplace constant is scaled by fine states / coarse states, so
+    both models put the same prior mass S * c in every row. Without that
+    the few coarse states soak up far more of the uniform part, and their
+    values sit several times above the fine ones.
+    """
+    if fine_state_space is None:
+        fine_state_space = fine_encoder.state_space
+    data, weeks, games = read_data_from_folders(folders, encoder=coarse_encoder)
+    transition_model, reward_matrix = estimate_transition_and_reward_matrices(
+        data,
+        laplace_constant * fine_state_space / coarse_encoder.state_space,
+        coarse_encoder.state_space,
+    )
+    policy, value_table = value_iteration(transition_model, reward_matrix, threshold=threshold)
+    return (
+        coarse_encoder.project(value_table, fine_encoder),
+        coarse_encoder.project(policy.astype(np.int64) - 1, fine_encoder),
+    )
 
 
-def write_policy_file(filename, policy):
-    with open(filename, "w") as f:
-        for i in range(len(policy)):
-            f.write(str(int(policy[i])) + "\n")
+def write_policies(outputfilename, policy, value_table, state_index=None, **metadata):
+    """
+    Writes the text policy file on the legacy grid and, with
+    WRITE_BINARY_POLICY, the binary policy file with its value table on the
+    ENCODER grid next to it. Compact solutions are expanded first.
+    """
+    if state_index is not None:
+        policy = state_index.expand_policy(policy)
+        value_table = state_index.expand(value_table, np.nan)
+    write_policy_file(outputfilename, ENCODER.project(policy, LEGACY_ENCODER))
+    if WRITE_BINARY_POLICY:
+        write_binary_policy(binary_policy_path(outputfilename), policy, value_table, ENCODER, **metadata)
 
 
 def main():
-    outputfilename = "results/model_based_test3.csv"
+    outputfilename = MODEL_BASED_POLICY_FILE
 
     # Folders containing the data
     folder1 = "data_cleaned/cleaned_2022_data"
     folder2 = "data_cleaned/cleaned_2023_data"
 
     # Read and combine data from both folders
-    combined_data = read_data_from_folders([folder1, folder2])
-
-    transition_matrix, reward_matrix = estimate_transition_and_reward_matrices(
-        combined_data
+    combined_data, weeks, games = read_data_from_folders([folder1, folder2], encoder=ENCODER)
+    metadata = dict(gamma=GAMMA, data=data_range([folder1, folder2], games))
+    state_index, state_space = None, ENCODER.state_space
+    if COMPACT_STATES:
+        state_index = StateIndex.from_transitions(combined_data, ENCODER)
+        combined_data = state_index.compact_transitions(combined_data)
+        state_space = state_index.size
+        print(state_space, "observed states")
+    incremental_name = "model_based_" + ENCODER.key + ("_compact" if COMPACT_STATES else "")
+
+    if INCREMENTAL:
+        start = time.time()
+        transition_model, reward_matrix, state, new_rows = update_incremental_model(
+            combined_data, games, state_space=state_space, name=incremental_name
+        )
+        print(new_rows, "new transitions")
+        if new_rows == 0 and "policy" in state:
+            optimal_policy, value_table = state["policy"], state["value_table"]
+        elif SOLVER == "policy_iteration":
+            previous = state.get("policy")
+            optimal_policy, value_table = policy_iteration(
+                transition_model,
+                reward_matrix,
+                policy=None if previous is None else previous.astype(np.int64) - 1,
+            )
+        else:
+            optimal_policy, value_table = value_iteration(
+                transition_model, reward_matrix, value_table=state.get("value_table")
+            )
+        save_incremental_model(
+            transition_model, state, value_table, optimal_policy, incremental_name
+        )
+        print(round(time.time() - start, 3), "seconds")
+        write_policies(outputfilename, optimal_policy, value_table, state_index,
+                       solver="incremental_" + SOLVER, **metadata)
+        return
+
+    transition_model, reward_matrix = estimate_transition_and_reward_matrices(
+        combined_data, state_space=state_space
     )
-    optimal_policy = value_iteration(transition_matrix, reward_matrix)
+    if COMPARE_SOLVERS:
+        compare_solvers(transition_model, reward_matrix)
+    value_table, policy = None, None
+    if COARSE_TO_FINE:
+        value_table, policy = coarse_warm_start(
+            [folder1, folder2], ENCODER, COARSE_ENCODER, fine_state_space=state_space
+        )
+        if state_index is not None:
+            value_table, policy = value_table[state_index.states], policy[state_index.states]
+    if SOLVER == "policy_iteration":
+        optimal_policy, value_table = policy_iteration(
+            transition_model, reward_matrix, policy=policy
+        )
+    elif SOLVER == "prioritized_sweeping":
+        optimal_policy, value_table = prioritized_sweeping(
+            transition_model, reward_matrix, value_table=value_table
+        )
+    else:
+        optimal_policy, value_table = value_iteration(
+            transition_model, reward_matrix, value_table=value_table
+        )
     print("policy")
     # You can write this policy to a file or use it as needed
-    write_policy_file(outputfilename, optimal_policy)
+    write_policies(outputfilename, optimal_policy, value_table, state_index, solver=SOLVER, **metadata)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.encoder import LEGACY_ENCODER
+from dataLoader.sharedMemory import share_transitions, attach_transitions, release_arrays
+from dataLoader.policyFile import write_policy_file
+from modelFreeRL.qlearning import (train_online, neighbor_index, neighbor_table,
+                                   GAMMA, LEARNING_RATE, NUMBER_OF_PASSES, NUMBER_OF_NEIGHBORS, ACTION_SPACE)
+
+# number of independently shuffled learners
+ENSEMBLE_SIZE = 8
+# "mean" (argmax of the mean Q table) or "vote" (majority of the learners' argmax)
+AGGREGATION = "mean"
+# seed of the learners' game orders
+SEED = 238
+# where the ensemble policy and its per-state disagreement are written
+OUTPUT_FILE = "results/q_learning_ensemble.csv"
+DISAGREEMENT_FILE = "results/q_learning_ensemble_disagreement.csv"
+
+# per-worker view of the shared transitions, set up once by _init_worker
+_worker = None
+
+def _init_worker(spec):
+    global _worker
+    blocks, data, columns = attach_transitions(spec)
+    _worker = {
+        'blocks': blocks,
+        'data': data,
+        'games': columns['games'],
+        'curdown_togo_fp_table': neighbor_table(LEGACY_ENCODER),
+    }
+
+"""
+Trains one learner over the games in an order shuffled by its own seed and
+returns its Q table.
+"""
+def train_learner(args):
+    seed, gamma, learning_rate, number_of_passes, k = args
+    game_order = np.random.default_rng(seed).permutation(np.unique(_worker['games']))
+    with contextlib.redirect_stdout(io.StringIO()):
+        policy, Q = train_online(_worker['data'], _worker['games'], _worker['curdown_togo_fp_table'],
+                                 gamma, learning_rate, number_of_passes, k, game_order)
+    return Q
+
+"""
+Trains ensemble_size learners across a process pool (processes=None uses
+all cores). Every worker attaches to one shared read-only copy of the
+transitions, and every learner gets an independent child seed.
+
+Returns the (ensemble_size, STATE_SPACE, ACTION_SPACE) stack of Q tables.
+"""
+def train_ensemble(data, games, ensemble_size=ENSEMBLE_SIZE, seed=SEED, processes=None,
+                   gamma=GAMMA, learning_rate=LEARNING_RATE, number_of_passes=NUMBER_OF_PASSES,
+                   k=NUMBER_OF_NEIGHBORS):
+    # build the neighbour index before the workers race to build it
+    neighbor_index(neighbor_table(LEGACY_ENCODER), k)
+    seeds = np.random.SeedSequence(seed).spawn(ensemble_size)
+    tasks = [(s, gamma, learning_rate, number_of_passes, k) for s in seeds]
+    blocks, spec = share_transitions(data, games=games)
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(spec,)) as executor:
+            return np.stack(list(executor.map(train_learner, tasks)))
+    finally:
+        release_arrays(blocks)
+
+"""
+Aggregates a stack of Q tables into one zero-indexed policy.
+"mean" takes the argmax of the mean Q table. "vote" takes the action most
+learners pick, and ties go to the action with the higher mean Q.
+
+Returns the policy, the (states, ACTION_SPACE) vote counts, and each state's
+disagreement: the fraction of learners whose argmax differs from the policy.
+"""
+def aggregate(Q_tables, aggregation=AGGREGATION):
+    ensemble_size, state_space, action_space = Q_tables.shape
+    learner_actions = np.argmax(Q_tables, axis=2)
+    votes = np.zeros((state_space, action_space), dtype=np.int64)
+    for a in range(action_space):
+        votes[:, a] = np.sum(learner_actions == a, axis=0)
+    mean_Q = np.mean(Q_tables, axis=0)
+    if aggregation == "vote":
+        # the mean Q only breaks ties between equally voted actions
+        tied = votes == np.max(votes, axis=1, keepdims=True)
+        policy = np.argmax(np.where(tied, mean_Q, -np.inf), axis=1)
+    else:
+        policy = np.argmax(mean_Q, axis=1)
+    disagreement = 1 - votes[np.arange(state_space), policy] / ensemble_size
+    return policy, votes, disagreement
+
+# usage: python modelFreeRL/ensemble.py [ensemble size] [mean|vote] (from the repository root)
+def main():
+    ensemble_size = int(sys.argv[1]) if len(sys.argv) > 1 else ENSEMBLE_SIZE
+    aggregation = sys.argv[2] if len(sys.argv) > 2 else AGGREGATION
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"])
+
+    start = time.time()
+    Q_tables = train_ensemble(data, games, ensemble_size)
+    print(ensemble_size, "learners in", round(time.time() - start, 2), "seconds")
+    policy, votes, disagreement = aggregate(Q_tables, aggregation)
+
+    visited = np.zeros(len(policy), dtype=bool)
+    visited[data.states] = True
+    print("mean disagreement:", round(np.mean(disagreement), 4),
+          "| on visited states:", round(np.mean(disagreement[visited]), 4))
+    print("states where any learner disagrees:", np.count_nonzero(disagreement > 0),
+          "| of them visited:", np.count_nonzero(disagreement[visited] > 0))
+
+    curDown, toGo, fp = LEGACY_ENCODER.decode(np.arange(len(policy)))
+    report = pd.DataFrame({'state': np.arange(len(policy)), 'down': curDown, 'toGo': toGo, 'fp': fp,
+                           'visited': visited, 'action': policy + 1, 'disagreement': disagreement})
+    for a in range(ACTION_SPACE):
+        report['votes_' + str(a + 1)] = votes[:, a]
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    report.to_csv(DISAGREEMENT_FILE, index=False)
+    write_policy_file(OUTPUT_FILE, policy + 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor
+
+# gamma value
+GAMMA = 0.9
+# upper bound on fitted Q iterations
+FITTED_Q_ITERATIONS = 100
+# iterations that grow new trees; later iterations keep the splits and only refit the leaves
+STRUCTURE_ITERATIONS = 5
+# stop once no Q value of a visited state moves more than this in an iteration
+FITTED_Q_TOLERANCE = 1e-2
+# extra trees settings
+NUMBER_OF_TREES = 50
+MIN_SAMPLES_LEAF = 5
+SEED = 238
+
+
+def features(curdown_togo_fp_table, states, actions):
+    # one row per (s, a): [curdown, togo, fp, action]
+    return np.column_stack([curdown_togo_fp_table[states], actions])
+
+
+# features of every (s, a) of the Q table, action-major
+def table_features(curdown_togo_fp_table, action_space):
+    state_space = len(curdown_togo_fp_table)
+    states = np.tile(np.arange(state_space), action_space)
+    actions = np.repeat(np.arange(action_space), state_space)
+    return features(curdown_togo_fp_table, states, actions)
+
+
+class frozen_forest():
+    """
+    The splits of a fitted tree ensemble, with leaf values that can be refit.
+
+    Every sample and every Q table row is mapped to its leaf in every tree
+    once. A refit is then one bincount of the targets over the leaves, and
+    a prediction is one gather and mean over the trees. That is exactly
+    what refitting the same trees would predict, because a regression leaf
+    holds the mean target of its samples.
+    """
+    def __init__(self, regressor, X, table_X):
+        # one id range per tree, so all leaves fit in one bincount
+        offsets = np.cumsum([0] + [tree.tree_.node_count for tree in regressor.estimators_[:-1]])
+        self.leaves = (regressor.apply(X) + offsets).ravel()
+        self.table_leaves = regressor.apply(table_X) + offsets
+        self.number_of_trees = len(offsets)
+        self.size = offsets[-1] + regressor.estimators_[-1].tree_.node_count
+        self.counts = np.maximum(np.bincount(self.leaves, minlength=self.size), 1)
+
+    def fit_predict(self, targets):
+        sums = np.bincount(self.leaves, weights=np.repeat(targets, self.number_of_trees), minlength=self.size)
+        return np.mean((sums / self.counts)[self.table_leaves], axis=1)
+
+
+"""
+Fitted Q iteration over the whole transition set as one batch.
+
+Every iteration builds all Bellman targets r + gamma * max_a' Q(s', a')
+at once, by gathering from the current Q table. terminal_state gets no
+bootstrap term. Extra trees are then fit on [curdown, togo, fp, action]
+features, and the next Q table is predicted for every state. Unvisited
+states get their values from the trees, so no imputation is needed.
+
+Refitting whole trees makes the iteration jitter, since the splits follow
+the targets. After structure_iterations the splits are frozen and only
+the leaf values are refit. The update is then an averager, which is a
+gamma-contraction, so the iteration converges.
+Both max_iterations and structure_iterations must be at least 1, since
+the first iteration has to grow the trees.
+Q warm-starts the first targets. The max change of Q on the visited
+states is appended to history when a list is given.
+
+Returns the one-indexed policy and the Q table.
+"""
+def fitted_q_iteration(data, curdown_togo_fp_table, gamma=GAMMA, terminal_state=None,
+                       action_space=4, Q=None, max_iterations=FITTED_Q_ITERATIONS,
+                       tolerance=FITTED_Q_TOLERANCE, structure_iterations=STRUCTURE_ITERATIONS,
+                       history=None):
+    if max_iterations < 1:
+        raise ValueError("max_iterations must be at least 1, got " + str(max_iterations))
+    if structure_iterations < 1:
+        raise ValueError("structure_iterations must be at least 1, got " + str(structure_iterations))
+    states, actions, rewards, next_states = (np.asarray(column) for column in data)
+    state_space = len(curdown_togo_fp_table)
+    if Q is None:
+        Q = np.zeros((state_space, action_space))
+    X = features(curdown_togo_fp_table, states, actions)
+    table_X = table_features(curdown_togo_fp_table, action_space)
+    bootstrap = np.ones(len(next_states))
+    if terminal_state is not None:
+        bootstrap[next_states == terminal_state] = 0
+    visited = np.unique(states)
+
+    for iteration in range(max_iterations):
+        targets = rewards + gamma * bootstrap * np.max(Q[next_states], axis=1)
+        if iteration < structure_iterations:
+            regressor = ExtraTreesRegressor(n_estimators=NUMBER_OF_TREES, min_samples_leaf=MIN_SAMPLES_LEAF,
+                                            random_state=SEED, n_jobs=-1)
+            regressor.fit(X, targets)
+            forest = frozen_forest(regressor, X, table_X)
+        prediction = forest.fit_predict(targets)
+        Q_prev, Q = Q, prediction.reshape(action_space, state_space).T
+        delta = np.max(np.abs(Q[visited] - Q_prev[visited]))
+        if history is not None:
+            history.append(delta)
+        if delta < tolerance:
+            break
+    print(iteration + 1, "iterations, max |dQ|:", delta)
+
+    policy = np.argmax(Q, axis=1) + 1
+    return policy, Q
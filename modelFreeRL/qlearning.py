@@ -1,16 +1,24 @@
 import numpy as np
+import hashlib
 import sys
 import os 
 import pandas as pd 
 import scipy 
+from scipy import sparse
+from scipy.sparse import linalg as splinalg
 import cvxpy as cp 
 import random 
 import time 
 from sklearn.neighbors import NearestNeighbors
-import ast  # Import the ast module for literal_eval
 
-# to denote s numerical value for terminal state 
-TERMINAL_STATE_VALUE = 10000
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders, split_by_game
+from dataLoader.incremental import load_state, save_state, pending_games, digest_arrays
+from dataLoader.stateIndex import StateIndex
+from dataLoader.encoder import LEGACY_ENCODER
+from dataLoader.policyFile import write_policy_file, write_binary_policy, binary_policy_path, data_range
+from modelFreeRL.fittedQ import fitted_q_iteration
+
 # size of state space (+1 to accommodate for terminal state)
 STATE_SPACE = 10001
 # size of action space 
@@ -21,11 +29,35 @@ GAMMA = 0.9
 LEARNING_RATE = 0.1
 # number of passings 
 NUMBER_OF_PASSES = 1
+# "online" (one pass per game file), "replay" (experience replay over all data)
+# or "fitted" (fitted Q iteration with a tree regressor over all data)
+TRAINING_MODE = "online"
+# experience replay settings
+REPLAY_MAX_EPOCHS = 2000
+REPLAY_BATCH_SIZE = 32
+REPLAY_TOLERANCE = 1e-3
+REPLAY_LEARNING_RATE_DECAY = 0.2
+SEED = 238
+# nearest neighbours used to approximate unvisited (s,a) pairs
+NUMBER_OF_NEIGHBORS = 10
+# where neighbour indices are saved between runs
+NEIGHBOR_CACHE_DIR = '.cache'
+# continue from the saved Q table and only train on games it has not seen yet
+INCREMENTAL = False
+# learn Q on the states seen in the data only, then expand the policy to STATE_SPACE rows
+COMPACT_STATES = False
+# grid Q is learned on; policy files are always written on the legacy grid
+ENCODER = LEGACY_ENCODER
+# also write the policy and max Q values as a binary policy file on the ENCODER grid
+WRITE_BINARY_POLICY = True
+
+# neighbour indices already loaded in this process
+_neighbor_indices = {}
 
 class QLearningMDP():
     # Action space A: {Pass, Run, kickFG, Punt}
     def __init__(self, action_space, state_space, gamma, Q, 
-                 TrackingTable, learning_rate, data, curdown_togo_fp_table):
+                 TrackingTable, learning_rate, data, curdown_togo_fp_table, k=None):
         # action space 
         self.action_space = action_space
         # state space 
@@ -42,6 +74,8 @@ class QLearningMDP():
         self.data = data 
         # ith row represents state i's curdown, togo, fp
         self.curdown_togo_fp_table = curdown_togo_fp_table
+        # number of neighbours (including the state itself) used for approximation
+        self.k = NUMBER_OF_NEIGHBORS if k is None else k
 
     def update(self, s, a, r, s_prime):
         self.Q[s, a] += self.learning_rate * (r + (self.gamma * np.max(self.Q[s_prime])) - self.Q[s, a])    
@@ -52,11 +86,11 @@ class QLearningMDP():
 
     Returns the argmax of Q[s] for each state s, where the 
     Q-value of unobserved state, action pairs were approximated using 
-    K-Nearest Neighbors (k=5). 
+    K-Nearest Neighbors (k=10). 
     """
     def QLearning(self):
         # iterate through every row in the data 
-        for row_data in self.data:
+        for row_data in zip(*self.data):
             # get transition data
             (s, a, r, s_prime) = row_data
             # fill the Q-table
@@ -64,109 +98,213 @@ class QLearningMDP():
             # update the tracking table 
             self.TrackingTable[s, a] = 1
 
+        return self.ApproximatePolicy()
+
+    """
+    Experience replay: runs up to max_epochs shuffled passes over all of the
+    data, each split into mini-batches of batch_size transitions. A batch is
+    one vectorized TD update; (s,a) pairs that appear several times in a
+    batch get the average of their TD errors. The step size of epoch n is
+    learning_rate / (1 + decay * n), which lets the noisy rewards average
+    out. Stops once the largest change of Q over an epoch is below tolerance.
+    max_epochs must be at least 1.
+
+    Returns the same approximated policy as QLearning.
+    """
+    def ExperienceReplay(self, max_epochs, batch_size, tolerance, decay=0.0, rng=None):
+        if max_epochs < 1:
+            raise ValueError("max_epochs must be at least 1, got " + str(max_epochs))
+        if rng is None:
+            rng = np.random.default_rng()
+        s, a, r, s_prime = (np.asarray(column) for column in self.data)
+        self.TrackingTable[s, a] = 1
+
+        for epoch in range(max_epochs):
+            Q_prev = np.copy(self.Q)
+            step = self.learning_rate / (1 + decay * epoch)
+            order = rng.permutation(len(s))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                bs, ba = s[batch], a[batch]
+                td_error = r[batch] + self.gamma * np.max(self.Q[s_prime[batch]], axis=1) - self.Q[bs, ba]
+                # number of times each (s,a) pair appears in the batch
+                _, inverse, counts = np.unique(bs * self.action_space + ba, return_inverse=True, return_counts=True)
+                np.add.at(self.Q, (bs, ba), step * td_error / counts[inverse])
+            delta = np.max(np.abs(self.Q - Q_prev))
+            if delta < tolerance:
+                break
+        print(epoch + 1, "epochs, max |dQ|:", delta)
+
+        return self.ApproximatePolicy()
+
+    """
+    Approximates the Q-value of every unvisited (s,a) pair from its nearest
+    neighbours and returns the one-indexed argmax policy.
+    """
+    def ApproximatePolicy(self):
         # Approximation: Nearest Neighbour
-        k = 10
-        neighbors_model = NearestNeighbors(n_neighbors=k, algorithm='ball_tree').fit(self.curdown_togo_fp_table)
-        # calculate nearest neighbors for all states 
-        d, ind = neighbors_model.kneighbors(self.curdown_togo_fp_table)  # ith row is ith state's [curdown, togo, fp]
-        # Approximate the Q-value for any s,a pair that didn't appear 
-        for s in range(self.state_space):  
-            for a in range(self.action_space):  
-                if self.TrackingTable[s][a] == 0: 
-                    for i in range(1, k):
-                        neighbor_index = ind[s][i]
-                        self.Q[s,a] += self.Q[neighbor_index, a]
-                    self.Q[s,a] = self.Q[s,a] / (len(ind[s]) - 1)
+        k = self.k
+        # ith row holds state i's k nearest states (itself first)
+        ind = neighbor_index(self.curdown_togo_fp_table, k)
+        # Approximate the Q-value for any s,a pair that didn't appear
+        missing = self.TrackingTable == 0
+        for a in range(self.action_space):
+            self.Q[:, a] = impute_column(self.Q[:, a], missing[:, a], ind[:, 1:])
 
         # compute optimal policy
-        policy = np.zeros(self.state_space)
-        for s in range(self.state_space): 
-            policy[s] = np.argmax(self.Q[s]) + 1  # one-index 
+        policy = np.argmax(self.Q, axis=1) + 1  # one-index 
 
         return policy 
 
-def write_policy_file(filename, policy):
-    with open(filename, 'w') as f:
-        for i in range(len(policy)):
-            f.write(str(int(policy[i])) + "\n")
-
-def process_data(inputfilepath):
-    # check if path exists
-    if not os.path.exists(inputfilepath):
-        return None 
-
-    # load data into numpy array
-    df = pd.read_csv(inputfilepath, sep=";")
-    df["State"] = df["State"].apply(ast.literal_eval)
-    df["Next_State"] = df["Next_State"].apply(ast.literal_eval)
-
-    # Change states to numerical state 
-    for i in range(len(df["State"])):
-        state_list, state_list_prime = df["State"][i], df["Next_State"][i]
-
-        # State: convert to numerical state value 
-        curDown, toGo, fp = int(state_list[0]), int(state_list[1]), int(state_list[2])
-        # handle edge case, where toGo is greater than 25, curDown is 5+, fp is 99+
-        toGo = min(25, toGo)
-        curDown = min(4, curDown)
-        fp = min(99, fp)
-        # update 
-        df.loc[i, "State"] = 100 * (toGo - 1) + 2500 * (curDown - 1) + (fp - 1)
-
-        # State prime: account for terminal case 
-        if state_list_prime[0] == "T":
-            df.loc[i, "Next_State"] = TERMINAL_STATE_VALUE
-        else:
-            curDown, toGo, fp = int(state_list_prime[0]), int(state_list_prime[1]), int(state_list_prime[2])
-            # handle edge case, where toGo is greater than 25, curDown is 5+, fp is 99+
-            toGo = min(25, toGo)
-            curDown = min(4, curDown)
-            fp = min(99, fp)
-            # update 
-            df.loc[i, "Next_State"] = 100 * (toGo - 1) + 2500 * (curDown - 1) + (fp - 1)
+"""
+Imputes the missing entries of one action's Q column from their neighbours.
+
+Visiting the states in order, every missing entry becomes
+(q[s] + sum of q over its neighbours) / (number of neighbours), where
+neighbours with a lower index that were missing already hold their imputed
+value. That in-order recurrence is a sparse lower-triangular system over the
+missing states, so it is solved in one call instead of state by state.
+"""
+def impute_column(q, missing, neighbors):
+    q = np.array(q, dtype=np.float64)
+    states = np.flatnonzero(missing)
+    if len(states) == 0:
+        return q
+    n_neighbors = neighbors.shape[1]
+    # position of each missing state in the system, -1 for observed states
+    position = np.full(len(q), -1)
+    position[states] = np.arange(len(states))
+
+    rows = np.repeat(np.arange(len(states)), n_neighbors)
+    cols = neighbors[states].ravel()
+    # neighbours that are imputed before the state itself
+    earlier = (cols < np.repeat(states, n_neighbors)) & missing[cols]
 
-    # zero index the data 
-    df["State"] -= 1
-    df["Next_State"] -= 1
-    df["Action"] -= 1
+    known = np.where(earlier, 0.0, q[cols])
+    rhs = (q[states] + np.bincount(rows, weights=known, minlength=len(states))) / n_neighbors
+    system = sparse.identity(len(states), format='csc') - sparse.csc_matrix(
+        (np.full(np.count_nonzero(earlier), 1.0 / n_neighbors), (rows[earlier], position[cols[earlier]])),
+        shape=(len(states), len(states)),
+    )
+    q[states] = splinalg.spsolve_triangular(system.tocsr(), rhs, lower=True)
+    return q
 
-    # convert to numpy for efficiency 
-    data = df.to_numpy()
+"""
+Returns the [curdown, togo, fp] table the nearest neighbours of every state
+are searched in. Row i holds the decoding of numeric state i, before the
+encoder's offset, which is the table main has always built.
+"""
+def neighbor_table(encoder=LEGACY_ENCODER):
+    return np.column_stack(encoder.decode(np.arange(encoder.state_space) + encoder.offset))
 
-    return data
+"""
+Returns the (num states, k) array of each row's k nearest rows in
+curdown_togo_fp_table. The ball tree query only runs once per table and k:
+the result is kept in memory and saved under cache_dir.
+"""
+def neighbor_index(curdown_togo_fp_table, k=NUMBER_OF_NEIGHBORS, cache_dir=NEIGHBOR_CACHE_DIR):
+    table = np.ascontiguousarray(curdown_togo_fp_table)
+    key = hashlib.sha1(table.tobytes() + str((table.shape, k)).encode()).hexdigest()[:16]
+    if key in _neighbor_indices:
+        return _neighbor_indices[key]
+
+    path = os.path.join(cache_dir, 'neighbors_k' + str(k) + '_' + key + '.npy')
+    if os.path.exists(path):
+        ind = np.load(path)
+    else:
+        neighbors_model = NearestNeighbors(n_neighbors=k, algorithm='ball_tree').fit(table)
+        # calculate nearest neighbors for all states 
+        d, ind = neighbors_model.kneighbors(table)  # ith row is ith state's [curdown, togo, fp]
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, ind)
+    _neighbor_indices[key] = ind
+    return ind
+
+"""
+Online training the way main does it: number_of_passes QLearning passes
+over every game, all updating one Q table from zeros. Games are visited in
+stored order, or in game_order (a sequence of game ids) when given.
+Returns the one-indexed policy after the last game and the Q table.
+"""
+def train_online(data, games, curdown_togo_fp_table, gamma=GAMMA, learning_rate=LEARNING_RATE,
+                 number_of_passes=NUMBER_OF_PASSES, k=NUMBER_OF_NEIGHBORS, game_order=None):
+    state_space = len(curdown_togo_fp_table)
+    Q = np.zeros((state_space, ACTION_SPACE))
+    TrackingTable = np.zeros((state_space, ACTION_SPACE))
+    optimal_policy = None
+    game_data = dict(split_by_game(data, games))
+    if game_order is None:
+        game_order = list(game_data)
+    for game in game_order:
+        for n in range(number_of_passes):
+            QLearningInstance = QLearningMDP(ACTION_SPACE, state_space, gamma, Q,
+                    TrackingTable, learning_rate, game_data[game], curdown_togo_fp_table, k)
+            optimal_policy = QLearningInstance.QLearning()
+    return optimal_policy, Q
 
 def main():
 
     # Step 1: INITIALIZE 
-    gamma, action_space, state_space, rate = GAMMA, ACTION_SPACE, STATE_SPACE, LEARNING_RATE
+    gamma, action_space, state_space, rate = GAMMA, ACTION_SPACE, ENCODER.state_space, LEARNING_RATE
     # initialize Q table
     Q = np.zeros((state_space, action_space))
     # initialize table to track which (s,a) has been explored
     TrackingTable = np.zeros((state_space, action_space))
     # store the optimal policy 
     optimal_policy = None
-    # initialize table for nearest neighbour 
-    curdown_togo_fp = []
-    for num_state in range(state_space):
-        curDown = num_state // 2500 + 1
-        toGo = (num_state % 2500) // 100 + 1
-        fp = (num_state % 2500) % 100 + 1
-        curdown_togo_fp.append([curDown, toGo, fp])
-    curdown_togo_fp_table = np.array(curdown_togo_fp)
+    # initialize table for nearest neighbour: ith row is state i's [curdown, togo, fp]
+    curdown_togo_fp_table = neighbor_table(ENCODER)
     start = time.time()
 
     # Step 2: ITERATE DATA & UPDATE Q TABLE
-    # iterate through 2023 data
-    for dir in ["cleaned_2023_data/23_24_", "cleaned_2022_data/22_23_"]:
-        for week_num in range(1, 22): 
-            # inputfilepath = "data_cleaned/cleaned_2023_data/23_24_week_" + str(week_num) + ".csv"
-            inputfilepath = 'data_cleaned/' + dir + 'week_' + str(week_num) + ".csv"
-            outputfilename = "/Users/elychen/CS238/cs238_Final_Project/results/trained_w_2023.csv"
+    # iterate through 2023 data, then 2022 data, one game (week) at a time
+    outputfilename = "/Users/elychen/CS238/cs238_Final_Project/results/trained_w_2023.csv"
+    folders = ["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"]
+    all_data, weeks, games = read_data_from_folders(folders, encoder=ENCODER)
+    state_index = None
+    terminal_state = ENCODER.terminal_state
+    if COMPACT_STATES:
+        state_index = StateIndex.from_transitions(all_data, ENCODER)
+        all_data = state_index.compact_transitions(all_data)
+        state_space = state_index.size
+        Q = np.zeros((state_space, action_space))
+        TrackingTable = np.zeros((state_space, action_space))
+        curdown_togo_fp_table = curdown_togo_fp_table[state_index.states]
+        terminal_state = state_index.compact(terminal_state) if state_index.contains(terminal_state) else None
+        print(state_space, "observed states")
 
-            data = process_data(inputfilepath)
+    new_games = set(games.tolist())
+    incremental_name = '_'.join(['q_learning', TRAINING_MODE, ENCODER.key] + (['compact'] if COMPACT_STATES else []))
+    if INCREMENTAL:
+        state = load_state(incremental_name)
+        new_game_list, digests, rebuild = pending_games(state, all_data, games)
+        if state and not rebuild and state['Q'].shape == Q.shape:
+            # warm start: the saved Q already holds every game folded in so far
+            Q, TrackingTable = state['Q'], state['TrackingTable']
+        else:
+            new_game_list = list(digests)
+        new_games = set(new_game_list)
+        print(len(new_games), "new games")
 
-            if data is None: continue
-            
+    if not new_games:
+        # nothing new since the saved Q table
+        optimal_policy = np.argmax(Q, axis=1) + 1
+    elif TRAINING_MODE == "fitted":
+        # one batch over all data; the regressor also covers unvisited states
+        optimal_policy, Q = fitted_q_iteration(all_data, curdown_togo_fp_table, gamma, terminal_state,
+                action_space, Q)
+        print(time.time() - start, "seconds")
+    elif TRAINING_MODE == "replay":
+        # load everything once and train to convergence
+        QLearningInstance = QLearningMDP(action_space, state_space, gamma, Q, 
+                TrackingTable, rate, all_data, curdown_togo_fp_table)
+        optimal_policy = QLearningInstance.ExperienceReplay(REPLAY_MAX_EPOCHS, REPLAY_BATCH_SIZE, 
+                REPLAY_TOLERANCE, REPLAY_LEARNING_RATE_DECAY, np.random.default_rng(SEED))
+        print(time.time() - start, "seconds")
+    else:
+        for game, data in split_by_game(all_data, games):
+            if game not in new_games:
+                continue
             # Step 3: train & obtain optimal policy 
             for n in range(NUMBER_OF_PASSES):
                 QLearningInstance = QLearningMDP(action_space, state_space, gamma, Q, 
@@ -174,10 +312,20 @@ def main():
                 optimal_policy = QLearningInstance.QLearning()
             end = time.time()
             print(end - start, "seconds")
-            print(inputfilepath)
+            print("game", game)
 
+    if INCREMENTAL and new_games:
+        save_state(incremental_name, dict(digest_arrays(digests), Q=Q, TrackingTable=TrackingTable))
+    value_table = np.max(Q, axis=1)
+    if state_index is not None:
+        optimal_policy = state_index.expand_policy(optimal_policy)
+        value_table = state_index.expand(value_table, np.nan)
     # Write Policy File 
-    write_policy_file(outputfilename, optimal_policy)
+    write_policy_file(outputfilename, ENCODER.project(optimal_policy, LEGACY_ENCODER))
+    if WRITE_BINARY_POLICY:
+        write_binary_policy(binary_policy_path(outputfilename), optimal_policy, value_table, ENCODER,
+                gamma=gamma, solver='q_learning_' + TRAINING_MODE,
+                data=data_range(folders, games))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
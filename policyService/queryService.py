@@ -0,0 +1,120 @@
+import json
+import os
+import socketserver
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.policyFile import read_binary_policy, binary_policy_path, MODEL_BASED_POLICY_FILE
+
+# binary policy file served when none is given: the one modelBased.main writes
+POLICY_FILE = binary_policy_path(MODEL_BASED_POLICY_FILE)
+# names of the one-indexed actions, as in csvParser's actions class
+ACTION_NAMES = ['pass', 'run', 'fieldGoal', 'punt']
+# the raw queries have to lie in these ranges
+MAX_DOWN = 4
+MAX_YARDS_TO_ENDZONE = 99
+
+
+class policy_service():
+    """
+    Answers play-call queries from a memory-mapped binary policy file.
+    Every query is a raw (down, toGo, yardsToEndzone) situation, encoded
+    with the encoding stored in the file's header, so a batch costs one
+    vectorized encode and two gathers.
+    """
+    def __init__(self, policy_fp):
+        self.header, self.encoder, self.actions, self.values = read_binary_policy(policy_fp)
+        self.latencies = []
+
+    """
+    Answers a batch of queries given as a (queries, 3) int array.
+    Returns the states, the one-indexed actions and their values.
+    """
+    def query(self, situations):
+        curDown, toGo, yards = situations.T
+        states = self.encoder.encode(curDown, toGo, yards)
+        return states, self.actions[states], self.values[states]
+
+    """
+    Parses one request line of whitespace-separated down,toGo,yardsToEndzone
+    triples, e.g. "1,10,75 3,2,40", answers it and returns the JSON
+    response line. The latency covers parsing, encoding and lookup.
+    """
+    def handle(self, line):
+        start = time.perf_counter()
+        try:
+            situations = np.array([triple.split(',') for triple in line.split()], dtype=np.int64).reshape(-1, 3)
+        except ValueError:
+            return json.dumps({'error': 'expected down,toGo,yardsToEndzone triples'})
+        invalid = ((situations[:, 0] < 1) | (situations[:, 0] > MAX_DOWN) | (situations[:, 1] < 1)
+                   | (situations[:, 2] < 1) | (situations[:, 2] > MAX_YARDS_TO_ENDZONE))
+        if np.any(invalid):
+            return json.dumps({'error': 'situation out of range', 'queries': np.flatnonzero(invalid).tolist()})
+        states, actions, values = self.query(situations)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        return json.dumps({
+            'states': states.tolist(),
+            'actions': actions.tolist(),
+            'calls': [ACTION_NAMES[a - 1] for a in actions],
+            'values': [None if np.isnan(v) else float(v) for v in values],
+            'latency_us': round(latency * 1e6, 1),
+        })
+
+    # median and 99th percentile latency of the answered requests, in microseconds
+    def latency_summary(self):
+        if not self.latencies:
+            return 'no requests answered'
+        latencies = np.array(self.latencies) * 1e6
+        return '{} requests, median {:.1f} us, p99 {:.1f} us'.format(
+            len(latencies), np.median(latencies), np.percentile(latencies, 99))
+
+
+# serves one request line per response line on stdin/stdout until EOF
+def serve_stdio(service):
+    for line in sys.stdin:
+        if line.strip():
+            print(service.handle(line), flush=True)
+
+
+# serves the same line protocol to TCP clients on localhost
+def serve_socket(service, port):
+    class handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(service.handle(line.decode()).encode() + b'\n')
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer(('127.0.0.1', port), handler) as server:
+        print('listening on 127.0.0.1 port', port, file=sys.stderr)
+        server.serve_forever()
+
+
+# usage: python policyService/queryService.py [results/model_based_test3.policy] [--port N] (from the repository root)
+def main():
+    args = sys.argv[1:]
+    port = None
+    if '--port' in args:
+        i = args.index('--port')
+        port = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+    policy_fp = args[0] if args else POLICY_FILE
+    if not os.path.exists(policy_fp):
+        sys.exit(policy_fp + ' not found; run modelBasedRL/modelBased.py or pass a .policy file')
+    service = policy_service(policy_fp)
+    print('policy on', service.encoder.key, json.dumps(service.header['metadata']), file=sys.stderr)
+    try:
+        if port is None:
+            serve_stdio(service)
+        else:
+            serve_socket(service, port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(service.latency_summary(), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# number of bootstrap resamples
+NUMBER_OF_RESAMPLES = 2000
+# confidence level of the intervals
+CONFIDENCE = 0.95
+# upper bound on resamples x games handled per block (bounds memory)
+BLOCK_ENTRIES = 2 * 10**7
+# seed of the resampler
+SEED = 238
+
+# game history shared with pool workers
+_game_history = None
+
+def _set_game_history(game_history):
+    global _game_history
+    _game_history = game_history
+
+"""
+Means of number_of_resamples bootstrap resamples of the games.
+game_history: (strategies, games) score history from tester.evaluate_policies
+
+The resample indices of a block are drawn as one (resamples, games) array,
+turned into per-game counts with a single bincount, and every strategy's
+mean comes out of one counts @ history.T product.
+
+Returns a (number_of_resamples, strategies) array.
+"""
+def bootstrap_means(game_history, number_of_resamples, rng):
+    num_strategies, number_of_games = game_history.shape
+    block_size = max(1, min(number_of_resamples, BLOCK_ENTRIES // number_of_games))
+    means = np.empty((number_of_resamples, num_strategies))
+    for start in range(0, number_of_resamples, block_size):
+        end = min(start + block_size, number_of_resamples)
+        size = end - start
+        idx = rng.integers(0, number_of_games, size=(size, number_of_games))
+        idx += np.arange(size)[:, None] * number_of_games
+        counts = np.bincount(idx.ravel(), minlength=size * number_of_games).reshape(size, number_of_games)
+        means[start:end] = (counts @ game_history.T) / number_of_games
+    return means
+
+def _bootstrap_worker(args):
+    number_of_resamples, seed = args
+    return bootstrap_means(_game_history, number_of_resamples, np.random.default_rng(seed))
+
+"""
+bootstrap_means spread across a process pool. Each worker gets the history
+once and an independent child seed, so results only depend on seed and
+processes.
+"""
+def parallel_bootstrap_means(game_history, number_of_resamples=NUMBER_OF_RESAMPLES, seed=SEED, processes=None):
+    if processes is None or processes <= 1:
+        return bootstrap_means(game_history, number_of_resamples, np.random.default_rng(seed))
+    chunks = [len(c) for c in np.array_split(np.arange(number_of_resamples), processes) if len(c)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_set_game_history, initargs=(game_history,)) as executor:
+        return np.concatenate(list(executor.map(_bootstrap_worker, zip(chunks, seeds))))
+
+"""
+Percentile bootstrap confidence intervals for every strategy's mean score and
+for every pairwise difference, resampling games jointly so the differences
+are paired.
+
+Returns two DataFrames:
+strategies: mean, ci_low, ci_high per strategy
+pairs: mean_diff, ci_low, ci_high and a two-sided bootstrap p-value for
+each ordered pair (i, j) with i < j
+"""
+def compare_strategies(game_history, names, number_of_resamples=NUMBER_OF_RESAMPLES,
+                       confidence=CONFIDENCE, seed=SEED, processes=None):
+    means = parallel_bootstrap_means(game_history, number_of_resamples, seed, processes)
+    tail = (1 - confidence) / 2 * 100
+    observed = np.mean(game_history, axis=1)
+
+    low, high = np.percentile(means, [tail, 100 - tail], axis=0)
+    strategies = pd.DataFrame({'mean': observed, 'ci_low': low, 'ci_high': high}, index=names)
+
+    i, j = np.triu_indices(len(names), k=1)
+    diffs = means[:, i] - means[:, j]
+    low, high = np.percentile(diffs, [tail, 100 - tail], axis=0)
+    p_values = np.minimum(1, 2 * np.minimum(np.mean(diffs <= 0, axis=0), np.mean(diffs >= 0, axis=0)))
+    pairs = pd.DataFrame({
+        'a': np.array(names)[i], 'b': np.array(names)[j],
+        'mean_diff': observed[i] - observed[j], 'ci_low': low, 'ci_high': high, 'p_value': p_values,
+    })
+    return strategies, pairs
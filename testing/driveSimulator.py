@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.transitions import TERMINAL_STATE, ACTION_SPACE, drive_ids, decode_states
+from modelBasedRL.modelBased import estimate_transition_and_reward_matrices
+from testing.tester import get_policy_tables, summarize_games
+
+# number of drives simulated per policy
+NUMBER_OF_DRIVES = 100000
+# drives still running after this many plays are cut off
+MAX_PLAYS_PER_DRIVE = 40
+# seed of the drive sampler
+SEED = 238
+# Laplace constant of the rollout model. The planning model's c = 1 over all
+# states would send nearly every simulated play to a uniformly random state;
+# 0 follows the observed counts (see drive_sampler for unvisited (s, a))
+ROLLOUT_LAPLACE_CONSTANT = 0
+
+"""
+Returns the first-down states that start a logged drive. A drive starts on
+the first row of the data and on every row after a TERMINAL next state.
+"""
+def first_down_states(data):
+    ids = drive_ids(data)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1])
+    start_states = data.states[starts]
+    curDown, toGo, fp = decode_states(start_states)
+    return start_states[curDown == 1]
+
+class drive_sampler():
+    """
+    Samples s' ~ T(. | s, a) from the counts of a sparse TransitionModel for a
+    whole batch of (s, a) pairs at once, with the rollout's own Laplace
+    constant c instead of the model's:
+
+        T(s' | s, a) = (N(s, a, s') + c) / (N(s, a) + S * c)
+
+    With c = 0 a visited (s, a) only moves to observed next states, and an
+    unvisited one falls back to the next states of action a pooled over all
+    states (a uniform next state would land on a never-visited state and
+    keep the drive wandering).
+
+    Every draw is a monotone function of one uniform u per (s, a): u scaled
+    to the row either lands inside the observed counts, found by searching a
+    per-action running sum of the count matrix (so no row is ever
+    densified), or in the smoothing remainder. Feeding every policy the
+    same u therefore gives common random numbers.
+    """
+    def __init__(self, transition_model, laplace_constant=ROLLOUT_LAPLACE_CONSTANT):
+        self.transition_model = transition_model
+        self.laplace_constant = laplace_constant
+        self.cumulative_counts = [np.cumsum(counts.data) for counts in transition_model.counts]
+        # running sum of N(a, s') over all s, uniform for an action never taken
+        self.pooled_counts = []
+        for counts in transition_model.counts:
+            pooled = np.asarray(counts.sum(axis=0)).ravel()
+            if pooled.sum() == 0:
+                pooled = np.ones(transition_model.state_space)
+            self.pooled_counts.append(np.cumsum(pooled))
+
+    def sample_next(self, states, actions, u):
+        model = self.transition_model
+        visits = model.visit_count[states, actions]
+        target = u * (visits + model.state_space * self.laplace_constant)
+        observed = target < visits
+        next_states = np.zeros(len(states), dtype=np.int64)
+        if self.laplace_constant > 0:
+            # the Laplace remainder is spread evenly over all S states
+            spill = ((target - visits) / self.laplace_constant).astype(np.int64)
+            next_states = np.minimum(spill, model.state_space - 1)
+        for a in range(model.action_space):
+            rows = np.flatnonzero(observed & (actions == a))
+            if len(rows) > 0:
+                counts, cumulative = model.counts[a], self.cumulative_counts[a]
+                row_start = counts.indptr[states[rows]]
+                # running count before the row, plus the drawn offset inside it
+                offset = np.where(row_start > 0, cumulative[np.maximum(row_start - 1, 0)], 0)
+                entry = np.searchsorted(cumulative, offset + target[rows], side='right')
+                next_states[rows] = counts.indices[entry]
+            if self.laplace_constant == 0:
+                rows = np.flatnonzero((visits == 0) & (actions == a))
+                pooled = self.pooled_counts[a]
+                next_states[rows] = np.searchsorted(pooled, u[rows] * pooled[-1], side='right')
+        return next_states
+
+"""
+Plays number_of_drives drives for every policy in policy_tables, a
+(num policies, STATE_SPACE) array of zero-indexed actions. Every policy
+starts from the same sampled first-down states and steps through the
+rollout model until TERMINAL (or max_plays), collecting the expected
+EPA-EPB reward_matrix[s, a] of each play. All drives advance together, one
+vectorized step per play.
+
+The uniforms are drawn once per (drive, play) and shared by all policies,
+so drive j of one policy is paired with drive j of every other: where two
+policies agree, their drives stay identical.
+
+Returns the (num policies, drives) arrays of total EPA-EPB per drive, of
+plays per drive, of plays taken from an unvisited (s, a) and of whether
+the drive was cut off at max_plays.
+"""
+def simulate_drives(transition_model, reward_matrix, policy_tables, start_states,
+                    number_of_drives=NUMBER_OF_DRIVES, rng=None, max_plays=MAX_PLAYS_PER_DRIVE,
+                    laplace_constant=ROLLOUT_LAPLACE_CONSTANT):
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+    sampler = drive_sampler(transition_model, laplace_constant)
+    initial_states = rng.choice(start_states, size=number_of_drives)
+    uniforms = rng.random((max_plays, number_of_drives))
+    drive_history = np.zeros((len(policy_tables), number_of_drives))
+    drive_lengths = np.zeros((len(policy_tables), number_of_drives), dtype=np.int64)
+    unvisited_plays = np.zeros((len(policy_tables), number_of_drives), dtype=np.int64)
+    truncated = np.zeros((len(policy_tables), number_of_drives), dtype=bool)
+
+    for i, policy in enumerate(policy_tables):
+        states = initial_states.copy()
+        active = np.arange(number_of_drives)
+        for play in range(max_plays):
+            actions = policy[states]
+            drive_history[i, active] += reward_matrix[states, actions]
+            drive_lengths[i, active] += 1
+            unvisited_plays[i, active] += transition_model.visit_count[states, actions] == 0
+            next_states = sampler.sample_next(states, actions, uniforms[play, active])
+            running = next_states != TERMINAL_STATE
+            states, active = next_states[running], active[running]
+            if len(active) == 0:
+                break
+        truncated[i, active] = True
+
+    return drive_history, drive_lengths, unvisited_plays, truncated
+
+# usage: python testing/driveSimulator.py results/a.csv results/b.csv ...
+def main():
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"])
+    transition_model, reward_matrix = estimate_transition_and_reward_matrices(data)
+    start_states = first_down_states(data)
+
+    policy_table_fps = sys.argv[1:] or ["results/q_learning.csv", "results/model_based.csv"]
+    policy_tables = np.concatenate([get_policy_tables(policy_table_fps),
+                                    np.repeat(np.arange(ACTION_SPACE)[:, None], transition_model.state_space, axis=1)])
+    names = [os.path.basename(fp) for fp in policy_table_fps] + ["always-action-" + str(a + 1) for a in range(ACTION_SPACE)]
+
+    start = time.time()
+    drive_history, drive_lengths, unvisited_plays, truncated = simulate_drives(transition_model, reward_matrix, policy_tables, start_states)
+    print(len(names) * NUMBER_OF_DRIVES, "drives in", round(time.time() - start, 2), "seconds")
+    print("rollout Laplace constant:", ROLLOUT_LAPLACE_CONSTANT,
+          "| logged plays per drive:", round(len(data.states) / len(np.unique(drive_ids(data))), 2), "\n")
+
+    means, win_rates, pairwise_wins = summarize_games(drive_history)
+    for i in np.argsort(-means):
+        print("Avg EPA-EPB per drive of " + names[i] + ":", means[i],
+              "| plays per drive:", round(np.mean(drive_lengths[i]), 2),
+              "| from unvisited (s, a):", str(round(100 * np.sum(unvisited_plays[i]) / np.sum(drive_lengths[i]), 1)) + "%",
+              "| cut off at " + str(MAX_PLAYS_PER_DRIVE) + " plays:", str(round(100 * np.mean(truncated[i]), 2)) + "%")
+    print("\nPairwise win rate over paired drives (row beats column):")
+    print(pd.DataFrame(pairwise_wins, index=names, columns=names).round(3).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import contextlib
+import io
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.incremental import INCREMENTAL_DIR
+from modelBasedRL.modelBased import (update_incremental_model, save_incremental_model,
+                                     estimate_transition_and_reward_matrices, value_iteration)
+
+# saved state the check writes and removes again
+CHECK_NAME = 'incremental_check'
+
+"""
+One INCREMENTAL run of modelBased.main on the given rows: fold the new
+games into the saved state, solve warm-started and save.
+Returns the number of newly folded transitions and the value table.
+"""
+def incremental_run(data, games, rows):
+    subset = type(data)(*(np.asarray(column)[rows] for column in data))
+    transition_model, reward_matrix, state, new_rows = update_incremental_model(
+        subset, games[rows], name=CHECK_NAME)
+    with contextlib.redirect_stdout(io.StringIO()):
+        policy, value_table = value_iteration(transition_model, reward_matrix,
+                                              value_table=state.get('value_table'))
+    save_incremental_model(transition_model, state, value_table, policy, CHECK_NAME)
+    return new_rows, value_table
+
+"""
+Runs the model based incremental mode on the first season, then on both
+seasons twice. The second season has to fold only its own rows, the
+repeated run none, and the counts must equal a from-scratch build.
+"""
+def main():
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2022_data", "data_cleaned/cleaned_2023_data"])
+    first_season = games < np.min(games) // 100 * 100 + 100
+    everything = np.ones(len(games), dtype=bool)
+    path = os.path.join(INCREMENTAL_DIR, CHECK_NAME + '.npz')
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        folded = [incremental_run(data, games, rows)[0] for rows in (first_season, everything, everything)]
+        transition_model, reward_matrix, state, new_rows = update_incremental_model(data, games, name=CHECK_NAME)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    expected = [int(np.count_nonzero(first_season)), int(np.count_nonzero(~first_season)), 0]
+    full_model, full_rewards = estimate_transition_and_reward_matrices(data)
+    same_counts = all((transition_model.counts[a] != full_model.counts[a]).nnz == 0
+                      for a in range(transition_model.action_space))
+    same_rewards = np.allclose(reward_matrix, full_rewards)
+    print('folded transitions per run:', folded, 'expected:', expected)
+    print('counts match a full build:', same_counts, '| rewards match:', same_rewards)
+    if folded != expected or not same_counts or not same_rewards:
+        sys.exit('incremental check failed')
+    print('incremental check passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.aggregates import build_payout_tables
+from dataLoader.transitions import STATE_SPACE, ACTION_SPACE, TERMINAL_STATE, drive_ids
+from testing.tester import get_policy_tables
+
+# discount of the evaluated returns
+GAMMA = 0.95
+# additive prior of the count-based behavior policy mu(a | s)
+BEHAVIOR_PRIOR = 0.5
+# the deterministic policies are evaluated epsilon-greedy, so off-policy plays keep some weight
+EPSILON = 0.1
+# fitted Q evaluation stops once no Q value moves more than this
+FQE_TOLERANCE = 1e-6
+FQE_MAX_ITERATIONS = 1000
+
+"""
+Count-based behavior policy mu(a | s) = (N(s, a) + prior) / (N(s) + A * prior)
+of the logged plays. Returns an (S, A) array.
+"""
+def behavior_policy(data, prior=BEHAVIOR_PRIOR, state_space=STATE_SPACE):
+    payout_table, state_counts, state_action_counts = build_payout_tables(data, state_space=state_space)
+    return (state_action_counts + prior) / (state_counts[:, None] + ACTION_SPACE * prior)
+
+"""
+pi(a_t | s_t) of every logged play under every epsilon-greedy policy in
+policy_tables, a (num policies, S) array of zero-indexed actions.
+Returns a (num policies, plays) array.
+"""
+def target_probabilities(policy_tables, states, actions, epsilon=EPSILON):
+    greedy = policy_tables[:, states] == actions
+    return np.where(greedy, 1 - epsilon + epsilon / ACTION_SPACE, epsilon / ACTION_SPACE)
+
+# index of the first play of every drive, and each play's step within its
+# drive, for the 0, 1, 2, ... drive ids of transitions.drive_ids
+def drive_steps(drives):
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(drives)) + 1])
+    return starts, np.arange(len(drives)) - starts[drives]
+
+"""
+Running product of ratios within every drive, for a (num policies, plays)
+array. Done as a cumulative sum of logs that restarts at drive starts, with
+zero ratios counted separately so a zero stays zero for the rest of its
+drive.
+"""
+def cumulative_weights(ratios, drives):
+    first = drive_steps(drives)[0][drives]
+    zero = ratios == 0
+    with np.errstate(divide='ignore'):
+        logs = np.where(zero, 0.0, np.log(np.where(zero, 1.0, ratios)))
+    log_sums = np.cumsum(logs, axis=1)
+    zero_counts = np.cumsum(zero, axis=1)
+    # totals just before each drive starts
+    log_before = np.concatenate([np.zeros((len(ratios), 1)), log_sums[:, :-1]], axis=1)[:, first]
+    zeros_before = np.concatenate([np.zeros((len(ratios), 1), dtype=np.int64), zero_counts[:, :-1]], axis=1)[:, first]
+    return np.exp(log_sums - log_before) * (zero_counts == zeros_before)
+
+"""
+Per-drive importance sampling estimates of the value of every policy in
+policy_tables, all drives and all policies at once.
+
+Returns a DataFrame with one row per policy:
+is: mean of the drive weight times the discounted drive return
+wis: the same, normalized by the sum of the drive weights
+pdis: per-decision IS, weighting each reward by the ratios up to its play
+ess: effective number of drives behind wis
+"""
+def importance_sampling(data, drives, behavior, policy_tables, gamma=GAMMA, epsilon=EPSILON):
+    states, actions, rewards = np.asarray(data.states), np.asarray(data.actions), np.asarray(data.rewards)
+    number_of_drives = drives[-1] + 1
+    num_policies = len(policy_tables)
+    starts, steps = drive_steps(drives)
+    discounted = gamma ** steps * rewards
+
+    ratios = target_probabilities(policy_tables, states, actions, epsilon) / behavior[states, actions]
+    weights = cumulative_weights(ratios, drives)
+    # per-policy, per-drive sums in one bincount each
+    flat = (np.arange(num_policies)[:, None] * number_of_drives + drives).ravel()
+    size = num_policies * number_of_drives
+    returns = np.bincount(drives, weights=discounted, minlength=number_of_drives)
+    # the weight of a whole drive is the running product at its last play
+    ends = np.concatenate([starts[1:] - 1, [len(states) - 1]])
+    drive_weights = weights[:, ends]
+    pdis = np.bincount(flat, weights=(weights * discounted).ravel(), minlength=size).reshape(num_policies, number_of_drives)
+
+    weighted = drive_weights * returns
+    return pd.DataFrame({
+        'is': np.mean(weighted, axis=1),
+        'wis': np.sum(weighted, axis=1) / np.sum(drive_weights, axis=1),
+        'pdis': np.mean(pdis, axis=1),
+        'ess': np.sum(drive_weights, axis=1) ** 2 / np.sum(drive_weights ** 2, axis=1),
+    })
+
+"""
+Tabular fitted Q evaluation of every epsilon-greedy policy in policy_tables
+on the logged transitions. Each iteration builds all targets
+r + gamma * sum_a' pi(a' | s') Q(s', a') at once, with no bootstrap past
+TERMINAL, and refits Q(s, a) as the mean target of its plays with one
+bincount per policy. (s, a) pairs that were never played stay 0.
+
+Returns the value of every policy averaged over the logged drive starts,
+and the (num policies, S, A) Q tables.
+"""
+def fitted_q_evaluation(data, drives, policy_tables, gamma=GAMMA, epsilon=EPSILON,
+                        tolerance=FQE_TOLERANCE, max_iterations=FQE_MAX_ITERATIONS):
+    states, actions, rewards, next_states = (np.asarray(column) for column in data)
+    num_policies, state_space = policy_tables.shape
+    pi = np.full((num_policies, state_space, ACTION_SPACE), epsilon / ACTION_SPACE)
+    pi[np.arange(num_policies)[:, None], np.arange(state_space), policy_tables] += 1 - epsilon
+    bootstrap = (next_states != TERMINAL_STATE).astype(np.float64)
+
+    pair = states * ACTION_SPACE + actions
+    flat = (np.arange(num_policies)[:, None] * state_space * ACTION_SPACE + pair).ravel()
+    size = num_policies * state_space * ACTION_SPACE
+    counts = np.maximum(np.bincount(flat, minlength=size), 1)
+    Q = np.zeros((num_policies, state_space, ACTION_SPACE))
+    for iteration in range(max_iterations):
+        next_values = np.sum(pi[:, next_states] * Q[:, next_states], axis=2)
+        targets = rewards + gamma * bootstrap * next_values
+        Q_prev, Q = Q, (np.bincount(flat, weights=targets.ravel(), minlength=size) / counts).reshape(Q.shape)
+        if np.max(np.abs(Q - Q_prev)) < tolerance:
+            break
+
+    starts, steps = drive_steps(drives)
+    start_states = states[starts]
+    values = np.sum(pi[:, start_states] * Q[:, start_states], axis=2)
+    return np.mean(values, axis=1), Q
+
+# usage: python testing/offPolicy.py results/a.csv results/b.csv ... (from the repository root)
+def main():
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"])
+    drives = drive_ids(data)
+    policy_table_fps = sys.argv[1:] or ["results/q_learning.csv", "results/model_based.csv"]
+    policy_tables = get_policy_tables(policy_table_fps)
+    names = [os.path.basename(fp) for fp in policy_table_fps]
+
+    start = time.time()
+    behavior = behavior_policy(data)
+    estimates = importance_sampling(data, drives, behavior, policy_tables)
+    estimates.insert(0, 'fqe', fitted_q_evaluation(data, drives, policy_tables)[0])
+    estimates.index = names
+    print(len(names), "policies,", drives[-1] + 1, "drives in", round(time.time() - start, 3), "seconds\n")
+
+    starts, steps = drive_steps(drives)
+    logged = np.bincount(drives, weights=GAMMA ** steps * np.asarray(data.rewards))
+    print("Logged (behavior) discounted return per drive:", np.mean(logged))
+    print(estimates.sort_values('fqe', ascending=False).round(4).to_string())
+
+if __name__ == '__main__':
+    main()
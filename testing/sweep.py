@@ -0,0 +1,163 @@
+import contextlib
+import io
+import itertools
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.aggregates import build_payout_tables
+from dataLoader.encoder import LEGACY_ENCODER
+from dataLoader.sharedMemory import share_transitions, attach_transitions, release_arrays
+from modelBasedRL.modelBased import (TransitionModel, transition_counts, value_iteration)
+from modelFreeRL.qlearning import train_online, neighbor_index, neighbor_table
+from testing.tester import evaluate_policies
+
+# parameter grids of every solver, swept as full cartesian products
+MODEL_BASED_GRID = {
+    'gamma': [0.8, 0.9, 0.95, 0.99],
+    'threshold': [0.1, 0.01, 0.001],
+    'laplace_constant': [0.1, 0.5, 1, 2, 5],
+}
+Q_LEARNING_GRID = {
+    'gamma': [0.8, 0.9, 0.95, 0.99],
+    'learning_rate': [0.05, 0.1, 0.2, 0.5],
+    'number_of_passes': [1, 2, 3],
+    'k': [5, 10, 20],
+}
+# games every candidate policy is scored on; all candidates play the same games
+NUMBER_OF_GAMES = 5000
+# seed of the scoring games
+SEED = 238
+# where the ranked sweep results are written
+OUTPUT_FILE = 'results/sweep.csv'
+
+# per-worker state set up once by _init_worker
+_worker = None
+
+def _init_worker(spec):
+    global _worker
+    blocks, data, columns = attach_transitions(spec)
+    payout_table, state_counts, state_action_counts = build_payout_tables(data)
+    _worker = {
+        'blocks': blocks,
+        'data': data,
+        'games': columns['games'],
+        # N(s, a, s') and N(s, a) are shared by every model based config
+        'counts': transition_counts(data),
+        'visit_count': state_action_counts,
+        'reward_matrices': {},
+        'payout_table': payout_table,
+        'probability_states': state_counts / np.sum(state_counts),
+        'curdown_togo_fp_table': neighbor_table(LEGACY_ENCODER),
+    }
+
+def _model_based_policy(gamma, threshold, laplace_constant):
+    # the smoothing only changes the normalizer, so the counts are reused as is
+    transition_model = TransitionModel(_worker['counts'], _worker['visit_count'], laplace_constant)
+    if laplace_constant not in _worker['reward_matrices']:
+        _worker['reward_matrices'][laplace_constant] = build_payout_tables(_worker['data'], laplace_constant)[0]
+    reward_matrix = _worker['reward_matrices'][laplace_constant]
+    policy, value_table = value_iteration(transition_model, reward_matrix, gamma, threshold)
+    return policy
+
+def _q_learning_policy(gamma, learning_rate, number_of_passes, k):
+    policy, Q = train_online(_worker['data'], _worker['games'], _worker['curdown_togo_fp_table'],
+                             gamma, learning_rate, number_of_passes, k)
+    return policy
+
+SOLVERS = {
+    'model_based': (MODEL_BASED_GRID, _model_based_policy),
+    'q_learning': (Q_LEARNING_GRID, _q_learning_policy),
+}
+
+"""
+Trains one config in a worker and scores its policy with the tester's
+evaluate_policies on NUMBER_OF_GAMES games drawn from SEED, so every config
+plays exactly the same games.
+"""
+def run_config(config):
+    solver, params = config
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        policy = SOLVERS[solver][1](**params)
+    seconds = time.time() - start
+    policy_tables = (np.ravel(policy).astype(np.int64) - 1)[None, :]
+    game_history = evaluate_policies(np.arange(len(_worker['payout_table'])), _worker['probability_states'],
+                                     _worker['payout_table'], policy_tables, NUMBER_OF_GAMES,
+                                     np.random.default_rng(SEED))
+    return dict(solver=solver, **params, score=np.mean(game_history[0]), seconds=seconds)
+
+# expands {solver: {param: values}} into (solver, params) configs
+def expand_grid(grids):
+    configs = []
+    for solver, grid in grids.items():
+        names = list(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+            configs.append((solver, dict(zip(names, values))))
+    return configs
+
+"""
+Loads the transitions once into shared memory and scores every config of
+grids across a process pool (processes=None uses all cores). The workers
+attach to the shared arrays, and each builds the count matrices once.
+
+Returns a DataFrame of the configs, best score first.
+"""
+def sweep(grids, processes=None):
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"])
+    configs = expand_grid(grids)
+    # neighbour indices go to disk before the workers race to build them
+    table = neighbor_table(LEGACY_ENCODER)
+    for k in sorted(set(params['k'] for solver, params in configs if solver == 'q_learning')):
+        neighbor_index(table, k)
+
+    blocks, spec = share_transitions(data, games=games)
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(spec,)) as executor:
+            results = list(executor.map(run_config, configs))
+    finally:
+        release_arrays(blocks)
+    return pd.DataFrame(results).sort_values('score', ascending=False, ignore_index=True)
+
+# parses solver.param=v1,v2 overrides, e.g. q_learning.k=5,10
+def parse_grids(args):
+    grids = {solver: dict(grid) for solver, (grid, run) in SOLVERS.items()}
+    for arg in args:
+        key, values = arg.split('=')
+        solver, name = key.split('.')
+        grids[solver][name] = [float(v) if '.' in v or 'e' in v else int(v) for v in values.split(',')]
+    return grids
+
+# usage: python testing/sweep.py [--processes N] [--only model_based] [model_based.gamma=0.9,0.95 ...]
+def main():
+    args = sys.argv[1:]
+    processes = None
+    if '--processes' in args:
+        i = args.index('--processes')
+        processes = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+    only = None
+    if '--only' in args:
+        i = args.index('--only')
+        only = args[i + 1].split(',')
+        args = args[:i] + args[i + 2:]
+    grids = parse_grids(args)
+    if only is not None:
+        grids = {solver: grid for solver, grid in grids.items() if solver in only}
+
+    start = time.time()
+    results = sweep(grids, processes)
+    print(len(results), 'configs in', round(time.time() - start, 2), 'seconds\n')
+    print(results.head(10).to_string(), '\n')
+    print('Best config of each solver:')
+    print(results.groupby('solver', sort=False).head(1).to_string())
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    results.to_csv(OUTPUT_FILE, index=False)
+
+if __name__ == '__main__':
+    main()
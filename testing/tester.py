@@ -1,20 +1,28 @@
 import os
+import sys
 import numpy as np
 import pandas as pd 
-import random 
-import ast  # Import the ast module for literal_eval
 import matplotlib.pyplot as plt 
+from scipy import sparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataLoader.cache import read_data_from_folders
+from dataLoader.aggregates import build_payout_tables
+from dataLoader.policyFile import is_binary_policy, read_policy
+from testing.bootstrap import compare_strategies
 
 # number of states to test (Assumption: 1 game = 100 states)
 NUMBER_OF_STATES_TO_TEST = 100 
 # number of games to test 
 NUMBER_OF_GAMES_TO_PLAY = 5000
-# to denote s numerical value for terminal state 
-TERMINAL_STATE_VALUE = 10000
 # size of state space (+1 to accommodate for terminal state)
 STATE_SPACE = 10001
 # size of action space 
 ACTION_SPACE = 4
+# number of games scored together
+GAME_BATCH_SIZE = 50000
+# seed of the game sampler
+SEED = 238
 
 class policy_tester():
     def __init__(self, payout_table):
@@ -23,147 +31,141 @@ class policy_tester():
 
     """
     policy table: policy pi to test
-    states_to_test: numerical states to feed to policy table & test
+    states_to_test: numerical states to feed to policy table & test, either
+    one game (num states,) or a batch of games (num games, num states)
 
     ASSUMES ZERO-INDEXING FOR STATES AND ACTIONS 
 
-    returns average score (average EPA-EPB)
+    returns average score (average EPA-EPB) of each game
     """
     def test_policy(self, policy_table, states_to_test):
-        cumulative_score = 0
-        # test each numerical state
-        for s in states_to_test:
-            # generate policy's action given the state
-            a = policy_table[s]
-            # generate score for this specific (s,a)
-            score = self.payout_table[s][a]
-            cumulative_score += score 
-
-        expected_payout = cumulative_score / len(states_to_test)
-        return expected_payout
-        
-    """
-    Returns the expected payout result of 5 baseline strategies (in the following order):
-    (1) Play Random 
-    (2) Max of [Always Playing Action 1, Always Playing Action 2, Always Playing Action 3, Always Playing Action 4]
-    """
-    def test_baseline_policy(self, states_to_test):
-        cumulative_scores = np.array([0,0,0,0,0])
-        for s in states_to_test:
-            # (1) play random 
-            random_action = random.randint(0, ACTION_SPACE - 1)
-            cumulative_scores[0] += self.payout_table[s, random_action]
-            # (2)(3)(4)(5)
-            for i in range(ACTION_SPACE):
-                a = i  # 0,1,2,3
-                cumulative_scores[i+1] = self.payout_table[s, a]
-
-        cumulative_scores = cumulative_scores / len(states_to_test)
-        return [cumulative_scores[0], np.max(cumulative_scores[1:])]
-
-# gets the policy table generated by Q learning or MLE
+        # gather the policy's action and its payout for every state at once
+        actions = np.ravel(policy_table)[states_to_test]
+        return np.mean(self.payout_table[states_to_test, actions], axis=-1)
+
+# gets the policy table generated by Q learning or MLE, from a text or binary policy file
 def get_policy_table(policy_table_fp):
-    df = pd.read_csv(policy_table_fp, header=None)
-    df = df.apply(lambda x: x - 1)
-    policy_table = np.array(df)
+    if is_binary_policy(policy_table_fp):
+        return (read_policy(policy_table_fp) - 1)[:, None]
+    df = pd.read_csv(policy_table_fp, header=None, dtype=np.int64)
+    policy_table = df.to_numpy() - 1
     return policy_table
+
+# stacks the policy tables of every file into one (num policies, STATE_SPACE) array
+def get_policy_tables(policy_table_fps):
+    return np.stack([np.ravel(get_policy_table(fp)) for fp in policy_table_fps])
     
 """
-Returns None if inputfilepath does not exist
-Returns numpy array with State, Action, Rewards, Next State columns 
-Zero-indexes states, action, new states
+Builds Walker's alias table for the state distribution, so that drawing a
+state costs one uniform index and one coin flip instead of a search.
+Returns (acceptance probability, alias) arrays.
 """
-def process_data(inputfilepath):
-    # check if path exists
-    if not os.path.exists(inputfilepath):
-        return None     
-
-    # load data into numpy array
-    df = pd.read_csv(inputfilepath, sep=";")
-    df["State"] = df["State"].apply(ast.literal_eval)
-    df["Next_State"] = df["Next_State"].apply(ast.literal_eval)
-
-    # Change states to numerical state 
-    for i in range(len(df["State"])):
-        state_list, state_list_prime = df["State"][i], df["Next_State"][i]
-
-        # State: convert to numerical state value 
-        curDown, toGo, fp = int(state_list[0]), int(state_list[1]), int(state_list[2])
-        # handle edge case, where toGo is greater than 25, curDown is 5+, fp is 99+
-        toGo = min(25, toGo)
-        curDown = min(4, curDown)
-        fp = min(99, fp)
-        # update 
-        df.loc[i, "State"] = 100 * (toGo - 1) + 2500 * (curDown - 1) + (fp - 1)
-
-        # State prime: account for terminal case 
-        if state_list_prime[0] == "T":
-            df.loc[i, "Next_State"] = TERMINAL_STATE_VALUE
-        else:
-            curDown, toGo, fp = int(state_list_prime[0]), int(state_list_prime[1]), int(state_list_prime[2])
-            # handle edge case, where toGo is greater than 25, curDown is 5+, fp is 99+
-            toGo = min(25, toGo)
-            curDown = min(4, curDown)
-            fp = min(99, fp)
-            # update 
-            df.loc[i, "Next_State"] = 100 * (toGo - 1) + 2500 * (curDown - 1) + (fp - 1)
-
-    # zero index the data 
-    df["State"] -= 1
-    df["Next_State"] -= 1
-    df["Action"] -= 1
-
-    # convert to numpy for efficiency 
-    data = df.to_numpy()
-
-    return data
+def build_alias_table(probability_states):
+    p = np.ravel(probability_states).astype(np.float64)
+    n = len(p)
+    prob = p * n / np.sum(p)
+    alias = np.arange(n)
+    small = list(np.flatnonzero(prob < 1))
+    large = list(np.flatnonzero(prob >= 1))
+    while small and large:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] -= 1 - prob[s]
+        (small if prob[l] < 1 else large).append(l)
+    # leftovers are 1 up to rounding
+    prob[small + large] = 1
+    return prob, alias
+
+# draws states_idx entries of the given shape through an alias table
+def sample_states(states_idx, alias_table, size, rng):
+    prob, alias = alias_table
+    i = rng.integers(0, len(prob), size=size)
+    return states_idx[np.where(rng.random(size) < prob[i], i, alias[i])]
 
 """
-Plays 10,000 simulated games, with each game having 100 states. 
+Plays NUMBER_OF_GAMES_TO_PLAY simulated games, with each game having 100 states. 
 The states are sampled based on how frequent each state appears in actual games. 
 This function plays 4 strategies:
 (1) Model Free
 (2) Model Based 
 (3) Random Action 
 (4) Max of Always Same Action 
-This function returns average score per game for each of the 4 strategies.
+All games of a batch are drawn as one (games, states) index array from rng and
+scored with gathers into the payout table.
+This function returns the summed score over games for each of the 4 strategies,
+the win counts and the (4, games) score history.
 """
 def simulate_games(states_idx, probability_states, expected_value_table, 
-                  policy_table_model_free, policy_table_model_based):
+                  policy_table_model_free, policy_table_model_based,
+                  number_of_games=NUMBER_OF_GAMES_TO_PLAY, rng=None, batch_size=GAME_BATCH_SIZE):
+    policy_tables = np.stack([np.ravel(policy_table_model_free), np.ravel(policy_table_model_based)])
+    game_history = evaluate_policies(states_idx, probability_states, expected_value_table, 
+                                     policy_tables, number_of_games, rng, batch_size)
+
+    # win count
+    wins = np.bincount(np.argmax(game_history, axis=0), minlength=4)
+    avg_model_free, avg_model_based, avg_random, avg_always_same = np.sum(game_history, axis=1)
     
-    game_history = [[], [], [], []]
-    avg_model_based, avg_model_free, avg_random, avg_always_same = 0,0,0,0
-    wins = [0,0,0,0]
+    return (avg_model_based, avg_model_free, avg_random, avg_always_same, wins, game_history)
+
+"""
+Plays number_of_games simulated games for every policy in policy_tables,
+a (num policies, STATE_SPACE) array of zero-indexed actions, plus the random
+and always-same-action baselines. All policies play the same sampled games.
 
-    # Play 10000 games (ModelFree vs ModelBased vs Random vs Max of always playing same action)
-    for i in range(NUMBER_OF_GAMES_TO_PLAY):
+Each batch of games is turned into a sparse (games, states) visit count
+matrix, and one sparse matrix product against the per-state payout of every
+policy and every fixed action scores all of them at once.
+
+Returns the (num policies + 2, games) score history: the policies in order,
+then random, then max of always playing the same action.
+"""
+def evaluate_policies(states_idx, probability_states, expected_value_table, policy_tables,
+                      number_of_games=NUMBER_OF_GAMES_TO_PLAY, rng=None, batch_size=GAME_BATCH_SIZE):
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+    alias_table = build_alias_table(probability_states)
+    num_policies = len(policy_tables)
+    # column i: payout of following policy i in each state, then each fixed action
+    rows = np.arange(len(expected_value_table))
+    payout_columns = np.column_stack([expected_value_table[rows, policy] for policy in policy_tables] 
+                                     + [expected_value_table[:, a] for a in range(ACTION_SPACE)])
+    game_history = np.empty((num_policies + 2, number_of_games))
+
+    for start in range(0, number_of_games, batch_size):
+        end = min(start + batch_size, number_of_games)
         # Sample States based on distribution 
-        states_to_test = np.random.choice(states_idx, size=NUMBER_OF_STATES_TO_TEST, p=probability_states.flatten())
-
-        # Test (get average score after simulating 100 states)
-        TestingInstance = policy_tester(expected_value_table)
-        model_free_score = TestingInstance.test_policy(policy_table_model_free, states_to_test)
-        model_based_score = TestingInstance.test_policy(policy_table_model_based, states_to_test)
-        random_score, always_same_score = TestingInstance.test_baseline_policy(states_to_test)
-        
-        print(model_free_score, model_based_score, random_score, always_same_score)
-
-        # Update History 
-        game_history[0].append(model_free_score)
-        game_history[1].append(model_based_score)
-        game_history[2].append(random_score)
-        game_history[3].append(always_same_score)
-
-        # Update scores 
-        avg_model_free += model_free_score
-        avg_model_based += model_based_score
-        avg_random += random_score
-        avg_always_same += always_same_score
-
-        # Update win count 
-        wins[np.argmax([model_free_score, model_based_score, random_score, always_same_score])] += 1
-    
-    return (avg_model_based, avg_model_free, avg_random, avg_always_same, wins, game_history)
+        states_to_test = sample_states(states_idx, alias_table, (end - start, NUMBER_OF_STATES_TO_TEST), rng)
+
+        # N(game, s), with one entry per sampled state
+        visits = sparse.csr_matrix(
+            (np.ones(states_to_test.size), states_to_test.ravel(), 
+             np.arange(0, states_to_test.size + 1, NUMBER_OF_STATES_TO_TEST)),
+            shape=(end - start, len(expected_value_table)),
+        )
+        scores = (visits @ payout_columns) / NUMBER_OF_STATES_TO_TEST
+        game_history[:num_policies, start:end] = scores[:, :num_policies].T
+        # random baseline: one uniformly drawn action per sampled state
+        random_actions = rng.integers(0, ACTION_SPACE, size=states_to_test.shape)
+        game_history[num_policies, start:end] = np.mean(expected_value_table[states_to_test, random_actions], axis=1)
+        game_history[num_policies + 1, start:end] = np.max(scores[:, num_policies:], axis=1)
+
+    return game_history
+
+"""
+Summarizes a (strategies, games) score history.
+Returns the mean score of each strategy, the fraction of games each strategy
+won outright (ties go to the first), and the pairwise matrix whose (i, j)
+entry is the fraction of games where i scored strictly more than j.
+"""
+def summarize_games(game_history):
+    num_strategies, number_of_games = game_history.shape
+    means = np.mean(game_history, axis=1)
+    win_rates = np.bincount(np.argmax(game_history, axis=0), minlength=num_strategies) / number_of_games
+    pairwise_wins = np.empty((num_strategies, num_strategies))
+    for i in range(num_strategies):
+        pairwise_wins[i] = np.mean(game_history[i] > game_history, axis=1)
+    return means, win_rates, pairwise_wins
 
 """
 Prints the average score of EPA-EPB for each state,action in a simulated game. 
@@ -173,34 +175,10 @@ def main():
 
     ###### Step 1: Create Expected Value/Payout Table via MLE ######
 
-    # Create a cum payout table (divide to get EV later)
-    cumulative_rewards_table = np.full((STATE_SPACE, ACTION_SPACE), 0) 
-    # Count the occurrences of each state (start with the count 4 for laplace)
-    visit_count_table = np.full((STATE_SPACE, ACTION_SPACE), 1)
-    # count state appearances 
-    visit_count_only_states = np.full((STATE_SPACE, 1), 0)
-
     # Count occurrences of each (s,a) pair for all files (zero-indexed)
-    for dir in ["cleaned_2023_data/23_24_", "cleaned_2022_data/22_23_"]:
-        for week_num in range(1, 22): 
-            inputfilepath = 'data_cleaned/' + dir + 'week_' + str(week_num) + ".csv"
-
-            # get data from each csv file 
-            data = process_data(inputfilepath)
-            # check if data is not none 
-            if data is None:  continue 
-            # traverse through each row in the file (s,a,r,s')
-            for row_data in data: 
-                (s,a,r,s_prime) = row_data
-                # R(s,a)
-                cumulative_rewards_table[s][a] += r 
-                # N(s,a) 
-                visit_count_table[s][a] += 1
-                # N(s)
-                visit_count_only_states[s] += 1
-    
-    # EV = R(s,a) / N(s,a)  (with laplace)
-    expected_value_table = cumulative_rewards_table / visit_count_table
+    data, weeks, games = read_data_from_folders(["data_cleaned/cleaned_2023_data", "data_cleaned/cleaned_2022_data"])
+    # EV = R(s,a) / (N(s,a) + 1)  (with laplace), and N(s)
+    expected_value_table, visit_count_only_states, visit_count_table = build_payout_tables(data)
 
     ###### Step 2: Calculate distribution of state probability, or N(s) / N ######
     probability_states = visit_count_only_states / np.sum(visit_count_only_states)
@@ -208,44 +186,37 @@ def main():
 
     ###### Step 3: Get Pre-Generated Policy Tables from Model Based & Model Free Learnings ######
 
-    ### (1) Get Q learning PolicyTable ###
-    policy_table_fp_model_free = "results/q_learning.csv"
-    policy_table_model_free = get_policy_table(policy_table_fp_model_free)
-    ### (2) Get Model Based Policy Table ###
-    policy_table_fp_model_based = "results/model_based.csv"
-    policy_table_model_based = get_policy_table(policy_table_fp_model_based)
+    # policy files to compare: python testing/tester.py results/a.csv results/b.csv ...
+    # (defaults to Q learning vs model based)
+    policy_table_fps = sys.argv[1:] or ["results/q_learning.csv", "results/model_based.csv"]
+    policy_tables = get_policy_tables(policy_table_fps)
+    names = [os.path.basename(fp) for fp in policy_table_fps] + ["random", "always-same-action"]
 
     ###### Step 4: Play Games & Test Scores for Results ######
 
-    # simulate 10000 games, where each game has 100 states sampled based on frequency distribution
-    (avg_model_based, avg_model_free, avg_random, avg_always_same, wins, game_history) = simulate_games(states_idx, probability_states, 
-                                                                                          expected_value_table, policy_table_model_free, 
-                                                                                          policy_table_model_based)
-    
-    # compute the average score for each policies 
-    avg_model_free /= NUMBER_OF_GAMES_TO_PLAY
-    avg_model_based /= NUMBER_OF_GAMES_TO_PLAY
-    avg_random /= NUMBER_OF_GAMES_TO_PLAY
-    avg_always_same /= NUMBER_OF_GAMES_TO_PLAY
-
-    # display results 
-    print("\nAvg Score of Playing Model Free Action:", avg_model_free[0], "| won", wins[0], "times")
-    print("Avg Score of Playing Model Based Action:", avg_model_based[0], "| won", wins[1], "times")
-    print("Avg Score of Playing Random Action:", avg_random, "| won", wins[2], "times")
-    print("Avg Score of Always Playing Same Action:", avg_always_same, "| won", wins[3], "times\n")
+    # simulate the games once for every policy, where each game has 100 states sampled based on frequency distribution
+    game_history = evaluate_policies(states_idx, probability_states, expected_value_table, policy_tables)
+    means, win_rates, pairwise_wins = summarize_games(game_history)
+
+    # display results, best average first
+    print()
+    for i in np.argsort(-means):
+        print("Avg Score of " + names[i] + ":", means[i], "| won", round(win_rates[i] * NUMBER_OF_GAMES_TO_PLAY), "times")
+    print("\nPairwise win rate (row beats column):")
+    print(pd.DataFrame(pairwise_wins, index=names, columns=names).round(3).to_string(), "\n")
+
+    # bootstrap confidence intervals and paired significance
+    strategies, pairs = compare_strategies(game_history, names)
+    print("Bootstrap 95% confidence intervals:")
+    print(strategies.round(4).to_string(), "\n")
+    print(pairs.round(4).to_string(index=False), "\n")
 
     # draw results 
     X = [i for i in range(1, 1+NUMBER_OF_GAMES_TO_PLAY)]
-    Y_model_free = game_history[0]
-    Y_model_based = game_history[1]
-    Y_random = game_history[2]
-    Y_always_same_action = game_history[3]
 
     # Plotting the lines
-    plt.plot(X, Y_model_free, label="model-free", linewidth=0.7, color="blue")
-    plt.plot(X, Y_model_based, label="model-based", linewidth=0.7, color="red")
-    plt.plot(X, Y_random, label="random", linewidth=0.7, color="orange")
-    plt.plot(X, Y_always_same_action, label="always-same-action", linewidth=0.7, color='green')
+    for name, Y in zip(names, game_history):
+        plt.plot(X, Y, label=name, linewidth=0.7)
 
     # Adding labels and title
     plt.xlabel('Number of Games')